@@ -0,0 +1,186 @@
+import os
+import random
+
+SIZES = {
+    'small': {'cards': 5, 'screenshots': 2, 'paragraphs': 2, 'changes': 1, 'noise': 5},
+    'typical': {'cards': 50, 'screenshots': 10, 'paragraphs': 10, 'changes': 5, 'noise': 50},
+    'huge': {'cards': 250, 'screenshots': 40, 'paragraphs': 60, 'changes': 30, 'noise': 400}
+}
+
+PAGE_TYPES = ('search', 'developer', 'details')
+
+PACKAGE_PREFIX = 'com.example'
+DEVELOPER_NAME = 'Example Developer'
+DETAILS_PACKAGE = 'com.example.app0'
+
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+          'incididunt ut labore et dolore magna aliqua ut enim ad minim veniam quis nostrud').split()
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choice(_WORDS) for _ in range(words))
+
+
+def _noise(rnd, count):
+    return ''.join(
+        '<div class="nav-item id-track-click"><a href="/store/apps/category/C%d">%s</a>'
+        '<span class="tooltip">%s</span></div>\n' % (idx, _text(rnd, 3), _text(rnd, 8))
+        for idx in range(count)
+    ) + '<script>var data = %r;</script>\n' % _text(rnd, count * 4)
+
+
+def _card(rnd, idx, developer):
+    return '''
+<div class="card no-rationale square-cover apps small" data-docid="%(package)s">
+  <div class="card-content id-track-click">
+    <a class="card-click-target" href="/store/apps/details?id=%(package)s" aria-hidden="true"></a>
+    <div class="cover"><div class="cover-image-container"><div class="cover-outer-align">
+      <img class="cover-image" src="//lh3.googleusercontent.com/%(package)s=w170"
+           data-cover-small="//lh3.googleusercontent.com/%(package)s=w85"
+           data-cover-large="//lh3.googleusercontent.com/%(package)s=w340" alt="Cover art"/>
+    </div></div></div>
+    <div class="details">
+      <a class="title" href="/store/apps/details?id=%(package)s" title="%(title)s">%(title)s</a>
+      <div class="subtitle-container">
+        <a class="subtitle" href="/store/apps/developer?id=%(developer)s" title="%(developer)s">%(developer)s</a>
+      </div>
+      <div class="description">
+        %(description)s<br/>
+        %(more)s
+      </div>
+    </div>
+    <div class="reason-set"><div class="tiny-star star-rating-non-editable-container"
+         aria-label=" Rated %(rating)s stars out of five stars "></div></div>
+  </div>
+</div>''' % {
+        'package': '%s.app%d' % (PACKAGE_PREFIX, idx),
+        'title': 'Example App %d' % idx,
+        'developer': developer or 'Developer %d' % idx,
+        'description': _text(rnd, 20),
+        'more': _text(rnd, 15),
+        'rating': '%.1f' % rnd.uniform(1, 5)
+    }
+
+
+def listing_page(size, developer=None, seed=42):
+    rnd = random.Random(seed)
+    spec = SIZES[size]
+
+    return '''<!DOCTYPE html>
+<html><head><title>Google Play</title>
+<link rel="canonical" href="https://play.google.com/store/search?q=%s"/>
+</head><body>
+<div id="wrapper">
+%s
+<div class="cluster-container"><div class="card-list">
+%s
+</div></div>
+%s
+</div>
+</body></html>''' % (PACKAGE_PREFIX,
+                     _noise(rnd, spec['noise']),
+                     '\n'.join(_card(rnd, idx, developer) for idx in range(spec['cards'])),
+                     _noise(rnd, spec['noise']))
+
+
+def details_page(size, package_name=DETAILS_PACKAGE, seed=42):
+    rnd = random.Random(seed)
+    spec = SIZES[size]
+
+    description = ''.join('<p>%s</p>' % _text(rnd, 60) for _ in range(spec['paragraphs']))
+    screenshots = '\n'.join(
+        '<img class="full-screenshot clickable" src="//lh3.googleusercontent.com/shot%d=h310" alt="Screenshot"/>' % idx
+        for idx in range(spec['screenshots'])
+    )
+    changes = '\n'.join('<div class="recent-change">%s</div>' % _text(rnd, 12) for _ in range(spec['changes']))
+    ratings = '\n'.join(
+        '<div class="rating-bar-container %s"><span class="bar-label">%d</span>'
+        '<span class="bar" style="width: %d%%;"></span><span class="bar-number">%d</span></div>' %
+        (name, stars, rnd.randint(1, 100), rnd.randint(0, 100000))
+        for stars, name in ((5, 'five'), (4, 'four'), (3, 'three'), (2, 'two'), (1, 'one'))
+    )
+
+    return '''<!DOCTYPE html>
+<html><head><title>Example App - Google Play</title>
+<link rel="canonical" href="https://play.google.com/store/apps/details?id=%(package)s"/>
+</head><body>
+%(noise)s
+<div class="main-content">
+  <div class="details-wrapper apps square-cover id-track-partial-impression" data-docid="%(package)s">
+    <div class="cover-container"><img class="cover-image" src="//lh3.googleusercontent.com/%(package)s=w300"/></div>
+    <div class="info-container">
+      <div class="document-title" itemprop="name"><div>Example App</div></div>
+      <div itemprop="author" itemscope="itemscope">
+        <a class="document-subtitle primary" href="/store/apps/developer?id=Example">
+          <span itemprop="name">%(developer)s</span></a>
+      </div>
+      <a class="document-subtitle category" href="/store/apps/category/TOOLS">
+        <span itemprop="genre">Tools</span></a>
+      <a class="document-subtitle category" href="/store/apps/category/FAMILY">
+        <span itemprop="genre">Family</span></a>
+    </div>
+  </div>
+  <div class="details-section screenshots"><div class="thumbnails">%(screenshots)s</div></div>
+  <div class="details-section description">
+    <div class="show-more-content text-body" itemprop="description">
+      <div jsname="C4s9Ed">%(description)s</div>
+    </div>
+  </div>
+  <div class="details-section reviews">
+    <div class="reviews">
+      <meta itemprop="ratingValue" content="4.3"/>
+      <meta itemprop="ratingCount" content="12345"/>
+      %(ratings)s
+    </div>
+  </div>
+  <div class="details-section whatsnew"><div class="whatsnew">%(changes)s</div></div>
+  <div class="details-section metadata">
+    <div class="content" itemprop="datePublished">January 1, 2017</div>
+    <div class="content" itemprop="numDownloads"> 10,000 - 50,000 </div>
+    <a class="dev-link" href="https://www.example.com/" rel="nofollow">Visit website</a>
+  </div>
+</div>
+%(noise)s
+</body></html>''' % {
+        'package': package_name,
+        'developer': DEVELOPER_NAME,
+        'noise': _noise(rnd, spec['noise']),
+        'screenshots': screenshots,
+        'description': description,
+        'ratings': ratings,
+        'changes': changes
+    }
+
+
+def generate(page_type, size):
+    if page_type == 'search':
+        return listing_page(size)
+
+    if page_type == 'developer':
+        return listing_page(size, developer=DEVELOPER_NAME)
+
+    return details_page(size)
+
+
+def load(directory=None):
+    """
+    Returns a dictionary of (page type, size) to HTML content.
+
+    Recorded pages named `<page type>-<size>.html` in `directory` are used
+    instead of the generated ones when they exist.
+    """
+
+    corpus = dict()
+
+    for page_type in PAGE_TYPES:
+        for size in SIZES:
+            path = os.path.join(directory, '%s-%s.html' % (page_type, size)) if directory else None
+
+            if path and os.path.exists(path):
+                with open(path) as recorded:
+                    corpus[(page_type, size)] = recorded.read()
+
+            else:
+                corpus[(page_type, size)] = generate(page_type, size)
+
+    return corpus
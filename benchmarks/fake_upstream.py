@@ -0,0 +1,182 @@
+"""
+Local stand-ins for Google Play used by the load test:
+a fake `GooglePlayAPI` for the `api` mode and an HTTP server
+serving the benchmark corpus pages for the `scraper` mode.
+"""
+
+import random
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler
+from SocketServer import ThreadingTCPServer
+from urlparse import urlsplit, parse_qs
+
+import corpus
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class _Behavior(object):
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            latency = self.latency + self._random.uniform(-self.jitter, self.jitter)
+
+        if latency > 0:
+            time.sleep(latency)
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class _Message(dict):
+    """
+    Allows attribute access like the protobuf messages of the real API.
+    """
+
+    def __getattr__(self, item):
+        return self.get(item)
+
+
+class FakeGooglePlayAPI(_Behavior):
+    """
+    Implements the parts of `googleplay_api.googleplay.GooglePlayAPI` used by `ApiClient`.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, results_per_search=20, seed=None):
+        super(FakeGooglePlayAPI, self).__init__(latency, jitter, error_rate, seed)
+
+        self.results_per_search = results_per_search
+        self.authSubToken = None
+
+    def login(self, email=None, password=None, authSubToken=None, proxy=None):
+        self.delay()
+        self.authSubToken = authSubToken or 'fake-token'
+
+    def search(self, query):
+        self._call()
+
+        return _Message(doc=[_Message(child=[
+            self._document('%s.app%d' % (query, idx)) for idx in xrange(self.results_per_search)
+        ])])
+
+    def details(self, package_name):
+        self._call()
+
+        return _Message(docV2=self._document(package_name))
+
+    def bulkDetails(self, package_names):
+        self._call()
+
+        return _Message(entry=[_Message(doc=self._document(name)) for name in package_names])
+
+    def _call(self):
+        self.delay()
+
+        if self.should_fail():
+            raise UpstreamError('Injected upstream failure')
+
+    @staticmethod
+    def _document(package_name):
+        return _Message(
+            title='Title of %s' % package_name,
+            creator=corpus.DEVELOPER_NAME,
+            shareUrl='https://play.google.com/store/apps/details?id=%s' % package_name,
+            descriptionHtml='Description of %s' % package_name,
+            details=_Message(appDetails=_Message(
+                packageName=package_name,
+                developerName=corpus.DEVELOPER_NAME,
+                uploadDate='Jan 1, 2017',
+                numDownloads='10,000+',
+                versionCode=42,
+                versionString='1.0.42'
+            )),
+            image=[_Message(
+                imageType=idx,
+                imageUrl='https://lh3.googleusercontent.com/%s-%d' % (package_name, idx),
+                dimension=_Message(width=512, height=512),
+                positionInSequence=idx
+            ) for idx in xrange(4)],
+            aggregateRating=_Message(
+                starRating=4.3, ratingsCount=12345, commentCount=678,
+                oneStarRatings=100, twoStarRatings=200, threeStarRatings=300,
+                fourStarRatings=4000, fiveStarRatings=7745
+            )
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+
+        server.delay()
+
+        if server.should_fail():
+            self._respond(503, 'Injected upstream failure')
+            return
+
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+
+        if parts.path == '/store/search':
+            self._respond(200, server.pages[('search', server.size)])
+
+        elif parts.path == '/store/apps/developer':
+            self._respond(200, server.pages[('developer', server.size)])
+
+        elif parts.path == '/store/apps/details' and query.get('id'):
+            self._respond(200, corpus.details_page(server.size, query['id'][0]))
+
+        else:
+            self._respond(404, 'Not found')
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePlayStoreServer(ThreadingTCPServer, _Behavior):
+    """
+    Serves the search, developer and details pages of the corpus
+    at the paths used by the `Scraper`, on a random local port.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, size='typical', corpus_directory=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        _Behavior.__init__(self, latency, jitter, error_rate, seed)
+
+        self.size = size
+        self.pages = corpus.load(corpus_directory)
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.1})
+        thread.daemon = True
+        thread.start()
+
+        return self
@@ -0,0 +1,244 @@
+"""
+Load test for the application against a local fake Google Play upstream.
+
+Usage (from the repository root):
+
+    PYTHONPATH=src python benchmarks/load_test.py [--api-types api,scraper] [--concurrency 16] [--requests 2000]
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Pipe, Process
+from urllib import quote
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpus
+from fake_upstream import FakeGooglePlayAPI, FakePlayStoreServer
+from http_client import HttpClient, HttpError
+
+ROUTES = ('search', 'developer', 'details')
+
+# the `api` mode does not support searching by developer
+DEFAULT_ROUTES = {
+    'api': ('search', 'details'),
+    'scraper': ROUTES
+}
+
+
+def _serve(api_type, options, port_sender):
+    """
+    Runs the fake upstream and the application in a separate process,
+    so the load generator does not compete with them for the GIL.
+    """
+
+    if options.server == 'gevent':
+        # like the gevent workers in gunicorn_config.py
+        from gevent import monkey
+
+        monkey.patch_all()
+
+    cache_directory = tempfile.mkdtemp()
+
+    os.environ.update({
+        'API_TYPE': api_type,
+        'CACHE_TYPE': options.cache_type,
+        'SCRAPER_CACHE_DIR': cache_directory,
+        'TOKEN_CACHE_PATH': '',
+        'GOOGLE_USERNAME': 'load-test@example.com',
+        'GOOGLE_PASSWORD': 'load-test',
+        'ANDROID_ID': '0123456789abcdef'
+    })
+
+    try:
+        import app as application
+        from werkzeug.serving import make_server
+
+        logging.getLogger('googleplay-proxy').setLevel(logging.WARN)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+        # the injected upstream failures would log a stack trace for each failed request
+        application.app.logger.setLevel(logging.CRITICAL)
+
+        if api_type == 'api':
+            application.get_api()._api = FakeGooglePlayAPI(
+                latency=options.latency, jitter=options.jitter, error_rate=options.error_rate
+            )
+
+        else:
+            upstream = FakePlayStoreServer(
+                size=options.page_size, corpus_directory=options.corpus,
+                latency=options.latency, jitter=options.jitter, error_rate=options.error_rate
+            ).start()
+
+            application.get_api().BASE_URL = upstream.base_url
+
+        if options.server == 'gevent':
+            from gevent.pywsgi import WSGIServer
+
+            server = WSGIServer(('127.0.0.1', 0), application.app, log=None)
+            server.start()
+
+        else:
+            server = make_server('127.0.0.1', 0, application.app, threaded=True)
+
+        port_sender.send(server.server_port)
+
+        server.serve_forever()
+
+    finally:
+        shutil.rmtree(cache_directory, ignore_errors=True)
+
+
+def _path(route, key):
+    if route == 'search':
+        return '/search/%s.app%d' % (corpus.PACKAGE_PREFIX, key)
+
+    if route == 'developer':
+        return '/developer/%s' % quote('%s %d' % (corpus.DEVELOPER_NAME, key))
+
+    return '/details/%s.app%d' % (corpus.PACKAGE_PREFIX, key)
+
+
+def _percentile(values, percentile):
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(len(values) * percentile / 100.0))]
+
+
+def _drive(base_url, routes, options):
+    """
+    Sends `options.requests` requests from `options.concurrency` threads
+    and returns the list of (route, latency, failed) tuples and the elapsed time.
+    """
+
+    client = HttpClient(pool_size=options.concurrency, read_timeout=options.timeout)
+    rnd = random.Random(options.seed)
+
+    plan = [(rnd.choice(routes), rnd.randint(0, options.keys - 1)) for _ in xrange(options.requests)]
+    plan_lock = threading.Lock()
+
+    samples = list()
+
+    def worker():
+        while True:
+            with plan_lock:
+                if not plan:
+                    return
+
+                route, key = plan.pop()
+
+            started_at = time.time()
+
+            try:
+                client.get('%s%s' % (base_url, _path(route, key)))
+                failed = False
+
+            except (HttpError, IOError):
+                failed = True
+
+            samples.append((route, time.time() - started_at, failed))
+
+    threads = [threading.Thread(target=worker) for _ in xrange(options.concurrency)]
+
+    started_at = time.time()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.time() - started_at
+
+    client.close()
+
+    return samples, elapsed
+
+
+def run(api_type, routes, options):
+    port_receiver, port_sender = Pipe(duplex=False)
+
+    server = Process(target=_serve, args=(api_type, options, port_sender))
+    server.daemon = True
+    server.start()
+
+    try:
+        if not port_receiver.poll(60):
+            raise RuntimeError('The application failed to start')
+
+        base_url = 'http://127.0.0.1:%d' % port_receiver.recv()
+
+        if options.warmup:
+            warmup_options = argparse.Namespace(**vars(options))
+            warmup_options.requests = options.warmup
+
+            _drive(base_url, routes, warmup_options)
+
+        return _drive(base_url, routes, options)
+
+    finally:
+        server.terminate()
+        server.join()
+
+
+def report(api_type, samples, elapsed):
+    print('\n%s (%d requests in %.2f seconds)' % (api_type, len(samples), elapsed))
+    print('%-12s %8s %8s %10s %10s %10s %10s' % ('route', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+
+    for route in ROUTES + ('total',):
+        selected = [sample for sample in samples if route in ('total', sample[0])]
+
+        if not selected:
+            continue
+
+        latencies = sorted(sample[1] * 1000.0 for sample in selected)
+
+        print('%-12s %8d %8d %10.1f %10.2f %10.2f %10.2f' % (
+            route, len(selected), sum(1 for sample in selected if sample[2]), len(selected) / elapsed,
+            _percentile(latencies, 50), _percentile(latencies, 95), _percentile(latencies, 99)
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test against a fake Google Play upstream')
+    parser.add_argument('--api-types', default='api,scraper', help='comma separated API types to test')
+    parser.add_argument('--server', default='threaded', choices=('threaded', 'gevent'),
+                        help='run the application on a threaded or on a gevent server (default: threaded)')
+    parser.add_argument('--routes', help='comma separated routes to request (default: all supported ones)')
+    parser.add_argument('--concurrency', type=int, default=16, help='number of concurrent clients (default: 16)')
+    parser.add_argument('--requests', type=int, default=2000, help='number of measured requests (default: 2000)')
+    parser.add_argument('--warmup', type=int, default=0, help='number of requests to send before measuring')
+    parser.add_argument('--keys', type=int, default=100,
+                        help='number of distinct packages and developers to request, '
+                             'lower values give higher cache hit ratios (default: 100)')
+    parser.add_argument('--latency', type=float, default=0.05, help='upstream latency in seconds (default: 0.05)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='upstream latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='ratio of failing upstream calls (0 - 1)')
+    parser.add_argument('--page-size', default='typical', choices=sorted(corpus.SIZES),
+                        help='size of the pages served to the scraper (default: typical)')
+    parser.add_argument('--corpus', help='directory with recorded pages named <type>-<size>.html')
+    parser.add_argument('--cache-type', default='simple', help='the CACHE_TYPE of the application (default: simple)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=42)
+
+    options = parser.parse_args()
+
+    for api_type in options.api_types.split(','):
+        routes = options.routes.split(',') if options.routes else DEFAULT_ROUTES[api_type]
+
+        samples, elapsed = run(api_type, routes, options)
+
+        report(api_type, samples, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Benchmarks the scraper's parsing of search, developer and details pages.
+
+Usage (from the repository root):
+
+    PYTHONPATH=src python benchmarks/parse_benchmark.py [--save-baseline FILE] [--baseline FILE]
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpus
+from disk_cache import DiskCache
+from scraper import Scraper, PARSERS
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+ENGINES = [(parser, partial) for parser in PARSERS for partial in (False, True)]
+
+
+def _available_engines():
+    from bs4 import BeautifulSoup, FeatureNotFound
+
+    for parser, partial in ENGINES:
+        try:
+            BeautifulSoup('<html></html>', parser)
+            yield parser, partial
+
+        except FeatureNotFound:
+            continue
+
+
+def _create_scraper(html, parser, partial, directory):
+    scraper = Scraper(disk_cache=DiskCache(directory, max_age=0),
+                      results_cache=DiskCache(os.path.join(directory, 'results'), max_age=0),
+                      parser=parser, partial_parsing=partial)
+
+    scraper._fetch = lambda url, page_type: html
+
+    return scraper
+
+
+def _scrape(scraper, page_type, arguments):
+    if page_type == 'search':
+        return list(scraper.scrape_search(arguments['search']))
+
+    if page_type == 'developer':
+        return list(scraper.scrape_developer(arguments['developer']))
+
+    return scraper.scrape_details(arguments['details'])
+
+
+def _measure(html, page_type, engine, arguments, repeats, results):
+    parser, partial = engine
+    directory = tempfile.mkdtemp()
+
+    try:
+        scraper = _create_scraper(html, parser, partial, directory)
+
+        # measure memory on the first (cold) run, as the process high water mark only grows
+        gc.collect()
+        gc.disable()
+
+        objects_before = len(gc.get_objects())
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if tracemalloc:
+            tracemalloc.start()
+
+        result = _scrape(scraper, page_type, arguments)
+
+        if tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        else:
+            peak = None
+
+        objects = len(gc.get_objects()) - objects_before
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+        gc.enable()
+
+        if not result:
+            results.put({'error': 'no results extracted'})
+            return
+
+        del result
+
+        timings = list()
+
+        for _ in range(repeats):
+            started_at = time.time()
+            _scrape(scraper, page_type, arguments)
+            timings.append(time.time() - started_at)
+
+        timings.sort()
+
+        results.put({
+            'median_ms': timings[len(timings) // 2] * 1000.0,
+            'min_ms': timings[0] * 1000.0,
+            'tracked_objects': objects,
+            'peak_kb': peak / 1024.0 if peak is not None else float(rss_growth)
+        })
+
+    except Exception as ex:
+        results.put({'error': repr(ex)})
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def run(pages, engines, arguments, repeats):
+    measurements = dict()
+
+    for (page_type, size), html in sorted(pages.items()):
+        for engine in engines:
+            # measure in a separate process, so the peak memory of one page does not hide another's
+            results = Queue()
+            process = Process(target=_measure, args=(html, page_type, engine, arguments, repeats, results))
+            process.start()
+
+            measurement = results.get()
+            process.join()
+
+            name = '%s/%s/%s%s' % (page_type, size, engine[0], '+partial' if engine[1] else '')
+            measurement['page_kb'] = len(html) / 1024.0
+
+            measurements[name] = measurement
+
+    return measurements
+
+
+def report(measurements, baseline=None, threshold=0.2):
+    regressions = list()
+
+    print('%-40s %10s %10s %10s %12s %10s %10s' % (
+        'page/engine', 'page (KB)', 'median ms', 'min ms', 'objects', 'peak KB', 'change'))
+
+    for name, measurement in sorted(measurements.items()):
+        if 'error' in measurement:
+            print('%-40s %s' % (name, measurement['error']))
+            regressions.append(name)
+            continue
+
+        change = ''
+
+        if baseline and name in baseline:
+            ratio = measurement['median_ms'] / baseline[name]['median_ms'] - 1.0
+            change = '%+.1f%%' % (ratio * 100)
+
+            if ratio > threshold:
+                regressions.append(name)
+                change += ' !'
+
+        print('%-40s %10.1f %10.2f %10.2f %12d %10.1f %10s' % (
+            name, measurement['page_kb'], measurement['median_ms'], measurement['min_ms'],
+            measurement['tracked_objects'], measurement['peak_kb'], change))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scraper parsing benchmark')
+    parser.add_argument('--corpus', help='directory with recorded pages named <type>-<size>.html')
+    parser.add_argument('--repeats', type=int, default=10, help='number of timed runs per page (default: 10)')
+    parser.add_argument('--engines', help='comma separated engines to run, like html.parser,lxml+partial')
+    parser.add_argument('--search-prefix', default=corpus.PACKAGE_PREFIX)
+    parser.add_argument('--developer', default=corpus.DEVELOPER_NAME)
+    parser.add_argument('--details-package', default=corpus.DETAILS_PACKAGE)
+    parser.add_argument('--baseline', help='compare with the results saved in this file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='maximum allowed slowdown compared to the baseline (default: 0.2 for 20%%)')
+    parser.add_argument('--save-baseline', help='save the results in this file')
+
+    args = parser.parse_args()
+
+    engines = list(_available_engines())
+
+    if args.engines:
+        selected = args.engines.split(',')
+        engines = [engine for engine in engines
+                   if '%s%s' % (engine[0], '+partial' if engine[1] else '') in selected]
+
+    arguments = {'search': args.search_prefix, 'developer': args.developer, 'details': args.details_package}
+
+    measurements = run(corpus.load(args.corpus), engines, arguments, args.repeats)
+
+    baseline = None
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressions = report(measurements, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(measurements, baseline_file, indent=2, sort_keys=True)
+
+    if regressions:
+        print('\nRegressions (more than %d%% slower or failing): %s' % (args.threshold * 100, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,91 @@
 import logging
 import time
 from functools import wraps
-from threading import Lock
+from threading import Lock, Thread
 
-from googleplay_api.googleplay import GooglePlayAPI, LoginError, DecodeError
+from googleplay_api.googleplay import GooglePlayAPI, LoginError, DecodeError, RequestError
+from prometheus_client import Counter, Histogram
+
+from batch import fetch_many, unique
+from coalescing import coalesced, SingleFlight
+from deadlines import DeadlineExceeded
+from governor import UpstreamGovernor, UpstreamUnavailable
+from ratelimit import TokenBucket
+from retry import RetryPolicy
+from tokens import TokenStore
+import deadlines
+import timing
 
 logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
 logger = logging.getLogger('googleplay-proxy')
 logger.setLevel(logging.INFO)
 
+LOGIN_DURATION = Histogram(
+    'googleplay_api_login_duration_seconds', 'Time spent logging in, including the retries'
+)
+LOGIN_ATTEMPTS = Counter(
+    'googleplay_api_login_attempts_total', 'Login attempts with credentials or stored tokens', ['result']
+)
+LOGIN_FAILURES = Counter(
+    'googleplay_api_login_failures_total', 'Logins failing after all the retries'
+)
+RELOGINS = Counter(
+    'googleplay_api_decode_error_relogins_total', 'Logins executed after failing to decode a response'
+)
+UPSTREAM_LATENCY = Histogram(
+    'googleplay_api_upstream_duration_seconds', 'Latency of the Google Play API calls', ['method']
+)
+EXTRACT_DURATION = Histogram(
+    'googleplay_api_extract_duration_seconds', 'Time spent extracting the items from the responses', ['method'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0)
+)
+
 
 def _with_login(method):
     @wraps(method)
     def wrapper(self, *args, **kwargs):
+        deadlines.check()
+
+        generation = self.token_generation()
+
         if not self.is_logged_in():
-            self.login()
+            self.login(generation)
+            generation = self.token_generation()
+
+        else:
+            self._refresh_token_if_due()
 
         try:
-            return method(self, *args, **kwargs)
+            self._wait_for_rate_limit()
+
+            with self._governor.permit(_is_upstream_failure):
+                return method(self, *args, **kwargs)
 
         except DecodeError as err:
             logger.warn('Failed to decode the response, possible authentication token issue: %s', err)
 
-            self.login()
-            return method(self, *args, **kwargs)
+            RELOGINS.inc()
+
+            self.login(generation)
+
+            self._wait_for_rate_limit()
+
+            with self._governor.permit(_is_upstream_failure):
+                return method(self, *args, **kwargs)
 
     return wrapper
 
 
+def _is_upstream_failure(error):
+    # errors reported by Google Play for the request itself (like unknown packages) mean it is healthy
+    return not isinstance(error, RequestError)
+
+
+def _is_upstream_login_failure(error):
+    # invalid credentials or revoked tokens do not mean Google Play is unhealthy
+    return not isinstance(error, LoginError)
+
+
 class ApiLoginException(BaseException):
     def __init__(self, cause):
         super(ApiLoginException, self).__init__(cause)
@@ -40,7 +98,10 @@ class ApiItem(dict):
 
 class ApiClient(object):
     def __init__(self, android_id=None, username=None, password=None,
-                 auth_token=None, proxy=None, max_login_retries=10, language=None, debug=False):
+                 auth_token=None, proxy=None, max_login_retries=10, language=None, debug=False,
+                 max_workers=8, bulk_details=False, bulk_chunk_size=100, token_cache_path=None,
+                 token_refresh_interval=None, rate_limit=None, rate_limit_burst=None, governor=None,
+                 login_retry_delay=0.2, login_retry_max_delay=5.0, retry_budget=None):
 
         self._api = GooglePlayAPI(android_id, language, debug)
 
@@ -48,42 +109,184 @@ class ApiClient(object):
         self._password = password
         self._auth_token = auth_token
         self._proxy = proxy
-        self._max_login_retries = max_login_retries
+        self._max_workers = max_workers
+        self._bulk_details = bulk_details
+        self._bulk_chunk_size = bulk_chunk_size
 
         self._login_lock = Lock()
         self._logged_in = False
+        self._current_token = None
+        self._token_created_at = 0
+        self._token_generation = 0
+        self._token_refresh_interval = token_refresh_interval
+        self._refreshing_token = False
+        self._refresh_lock = Lock()
+
+        if token_cache_path and not auth_token:
+            self._token_store = TokenStore(token_cache_path)
+        else:
+            self._token_store = None
+
+        if rate_limit:
+            self._rate_limiter = TokenBucket(rate_limit, rate_limit_burst)
+        else:
+            self._rate_limiter = None
+
+        self._governor = governor or UpstreamGovernor()
+
+        self._login_retry = RetryPolicy(
+            'login', max_attempts=max_login_retries, base_delay=login_retry_delay, max_delay=login_retry_max_delay,
+            retryable=lambda error: isinstance(error, LoginError), budget=retry_budget
+        )
+
+        self._single_flight = SingleFlight()
 
     def is_logged_in(self):
         return self._logged_in
 
-    def login(self):
-        self._logged_in = False
+    def has_capacity(self):
+        return self._rate_limiter is None or self._rate_limiter.available() >= 1
 
-        with self._login_lock:
-            logger.info('Executing login')
+    def _wait_for_rate_limit(self):
+        if self._rate_limiter is not None and not self._rate_limiter.acquire(timeout=deadlines.timeout()):
+            raise DeadlineExceeded('Request deadline exceeded while waiting for the account rate limit')
 
-            login_error = None
+    def token_generation(self):
+        return self._token_generation
 
-            for _ in xrange(self._max_login_retries):
-                try:
-                    self._api.login(self._username, self._password, self._auth_token, self._proxy)
-                    self._logged_in = True
-                    break
+    def login(self, generation=None):
+        """
+        Executes the login, unless another login has finished since
+        the given token `generation` was current.
+        The current token keeps being used until the new one is ready.
+        """
 
-                except LoginError as err:
-                    login_error = err
-                    time.sleep(0.2)
+        # an unbounded wait would hold every request thread behind a stuck login
+        deadlines.acquire(
+            lambda: self._login_lock.acquire(False), 'Request deadline exceeded while waiting for another login'
+        )
 
-            else:
-                logger.error('Failed to log in: %s', login_error)
-                raise ApiLoginException(login_error)
+        try:
+            if generation is not None and generation != self._token_generation:
+                return
 
-    @_with_login
+            with LOGIN_DURATION.time(), timing.measure('login'):
+                if self._token_store is None:
+                    self._login_with_credentials()
+
+                else:
+                    with self._token_store.locked():
+                        if not self._login_with_stored_token():
+                            self._login_with_credentials()
+
+                            if self._current_token:
+                                self._token_store.save(self._current_token, self._token_created_at)
+
+            self._token_generation += 1
+            self._logged_in = True
+
+        finally:
+            self._login_lock.release()
+
+    def _refresh_token_if_due(self):
+        if not self._token_refresh_interval or self._refreshing_token:
+            return
+
+        if time.time() < self._token_created_at + self._token_refresh_interval:
+            return
+
+        with self._refresh_lock:
+            if self._refreshing_token:
+                return
+
+            self._refreshing_token = True
+
+        refresh = Thread(target=self._refresh_token, args=(self._token_generation,), name='token-refresh')
+        refresh.daemon = True
+        refresh.start()
+
+    def _refresh_token(self, generation):
+        logger.info('Refreshing the authentication token in the background')
+
+        try:
+            self.login(generation)
+
+        except (ApiLoginException, UpstreamUnavailable, DeadlineExceeded) as ex:
+            logger.warn('Failed to refresh the authentication token, keeping the current one: %s', ex)
+
+        finally:
+            self._refreshing_token = False
+
+    def _login_with_stored_token(self):
+        token, created_at = self._token_store.load()
+
+        if token is None:
+            return False
+
+        if token == self._current_token:
+            # this is the token that has just stopped working or is due to be refreshed
+            self._token_store.invalidate(token)
+            return False
+
+        if self._token_refresh_interval and time.time() >= created_at + self._token_refresh_interval:
+            return False
+
+        logger.info('Executing login with a stored authentication token')
+
+        try:
+            with self._governor.permit(_is_upstream_login_failure), UPSTREAM_LATENCY.labels('login').time():
+                self._api.login(None, None, token, self._proxy)
+
+            LOGIN_ATTEMPTS.labels('success').inc()
+
+        except (UpstreamUnavailable, DeadlineExceeded):
+            raise
+
+        except Exception as err:
+            LOGIN_ATTEMPTS.labels('failure').inc()
+
+            logger.warn('Failed to log in with the stored authentication token: %s', err)
+
+            self._token_store.invalidate(token)
+            return False
+
+        self._current_token = token
+        self._token_created_at = created_at
+
+        return True
+
+    def _login_with_credentials(self):
+        logger.info('Executing login')
+
+        try:
+            self._login_retry.call(self._login_attempt)
+
+        except LoginError as err:
+            LOGIN_FAILURES.inc()
+
+            logger.error('Failed to log in: %s', err)
+            raise ApiLoginException(err)
+
+    def _login_attempt(self):
+        try:
+            with self._governor.permit(_is_upstream_login_failure), UPSTREAM_LATENCY.labels('login').time():
+                self._api.login(self._username, self._password, self._auth_token, self._proxy)
+
+        except LoginError:
+            LOGIN_ATTEMPTS.labels('failure').inc()
+            raise
+
+        LOGIN_ATTEMPTS.labels('success').inc()
+
+        self._current_token = getattr(self._api, 'authSubToken', None)
+        self._token_created_at = time.time()
+
+    @coalesced
     def search(self, package_prefix):
-        logger.info('Searching for %s', package_prefix)
+        return list(self.iter_search(package_prefix))
 
-        results = list()
-        response = self._api.search(package_prefix)
+    def iter_search(self, package_prefix):
+        response = self._search(package_prefix)
 
         if len(response.doc):
             document = response.doc[0]
@@ -94,21 +297,74 @@ class ApiClient(object):
                 if not package_name.startswith(package_prefix):
                     continue
 
-                item = self._extract_api_item(child, simple=True)
+                with EXTRACT_DURATION.labels('search').time(), timing.measure('parse'):
+                    item = self._extract_api_item(child, simple=True)
 
-                results.append(item)
+                yield item
 
-        return results
+    @_with_login
+    def _search(self, package_prefix):
+        logger.info('Searching for %s', package_prefix)
+
+        with UPSTREAM_LATENCY.labels('search').time(), timing.measure('upstream'):
+            return self._api.search(package_prefix)
 
     def developer(self, developer_name):
         raise NotImplementedError('Searching by developer is not supported')
 
+    def iter_developer(self, developer_name):
+        raise NotImplementedError('Searching by developer is not supported')
+
+    @coalesced
     @_with_login
     def get_details(self, package_name):
         logger.info('Fetching details for %s', package_name)
 
-        details = self._api.details(package_name)
-        return self._extract_api_item(details.docV2, simple=False)
+        with UPSTREAM_LATENCY.labels('details').time(), timing.measure('upstream'):
+            details = self._api.details(package_name)
+
+        with EXTRACT_DURATION.labels('details').time(), timing.measure('parse'):
+            return self._extract_api_item(details.docV2, simple=False)
+
+    def get_details_many(self, package_names, failures=None):
+        if self._bulk_details:
+            # unknown packages are returned as `None` by the bulk requests
+            return self.get_details_bulk(package_names)
+
+        logger.info('Fetching details for %d packages', len(package_names))
+
+        return fetch_many(self.get_details, package_names, self._max_workers, failures)
+
+    def get_details_bulk(self, package_names):
+        package_names = unique(package_names)
+
+        chunks = [tuple(package_names[idx:idx + self._bulk_chunk_size])
+                  for idx in xrange(0, len(package_names), self._bulk_chunk_size)]
+
+        logger.info('Fetching details for %d packages in %d bulk requests', len(package_names), len(chunks))
+
+        results = dict()
+
+        for chunk_results in fetch_many(self._get_details_chunk, chunks, self._max_workers).values():
+            results.update(chunk_results)
+
+        return results
+
+    @_with_login
+    def _get_details_chunk(self, package_names):
+        with UPSTREAM_LATENCY.labels('bulk_details').time(), timing.measure('upstream'):
+            response = self._api.bulkDetails(list(package_names))
+
+        results = dict.fromkeys(package_names)
+
+        with EXTRACT_DURATION.labels('bulk_details').time(), timing.measure('parse'):
+            for entry in response.entry:
+                package_name = entry.doc.details.appDetails.packageName
+
+                if package_name in results:
+                    results[package_name] = self._extract_api_item(entry.doc, simple=False)
+
+        return results
 
     @staticmethod
     def _extract_api_item(api_object, simple):
@@ -1,19 +1,48 @@
+import hmac
+import json
 import logging
 import os
+import random
+import tempfile
+import time
+from hashlib import md5
+from threading import Lock
 
-from flask import Flask, jsonify
+from flask import Flask, abort, g, jsonify, request
 from flask_cache import Cache
 from flask_cors import CORS
+from werkzeug.exceptions import NotFound
 
 from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics
 from docker_helper import read_configuration
 
-from api import ApiClient
+from api import ApiClient, RequestError
+from batch import unique
+from caching import cache_configuration, create_negative_cache, create_response_cache
+from deadlines import DeadlineExceeded
+from disk_cache import DiskCache
+from governor import UpstreamUnavailable, create_upstream_governor
+from http_client import HttpClient, HttpError
+from pool import ApiClientPool
+from profiling import SamplingProfiler
+from responses import DEFAULT_ENCODINGS, encode, join_object, serialize, supported_encodings
+from retry import create_retry_budget
 from scraper import Scraper
+import deadlines
+import timing
 
 app = Flask(__name__)
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
-metrics = PrometheusMetrics(app)
+cache = Cache(app, config=cache_configuration())
+response_cache = create_response_cache(cache, negative_cache=create_negative_cache(
+    lambda error: _is_permanent_error(error)  # defined with the error handlers below
+))
+
+if os.environ.get('prometheus_multiproc_dir'):
+    # aggregate the metrics of all the server worker processes
+    metrics = GunicornInternalPrometheusMetrics(app)
+else:
+    metrics = PrometheusMetrics(app)
 
 metrics.info('flask_app_info', 'Application info',
              version=os.environ.get('GIT_COMMIT') or 'unknown')
@@ -26,58 +55,551 @@ metrics.info(
 
 CORS(app, origins=read_configuration(
     'CORS_ORIGINS', '/var/secrets/secrets.env', default='http://localhost:?.*'
-).split(','), methods='GET')
+).split(','), methods=['GET', 'POST'])
 
 logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
 logger = logging.getLogger('googleplay-proxy')
 logger.setLevel(logging.INFO)
 
+# shared by all the API clients of the process to guard the calls to Google Play
+upstream_governor = create_upstream_governor()
+retry_budget = create_retry_budget()
+
 
 def load_api():
     api_type = read_configuration('API_TYPE', '/var/secrets/secrets.env', default='api')
+    max_workers = int(read_configuration('MAX_UPSTREAM_WORKERS', '/var/secrets/secrets.env', default='8'))
 
     if api_type == 'api':
-        return ApiClient(
-            android_id=read_configuration('ANDROID_ID', '/var/secrets/secrets.env'),
-            username=read_configuration('GOOGLE_USERNAME', '/var/secrets/secrets.env'),
-            password=read_configuration('GOOGLE_PASSWORD', '/var/secrets/secrets.env'),
-            max_login_retries=int(read_configuration(
-                'MAX_LOGIN_RETRIES', '/var/secrets/secrets.env', default='10'
-            ))
+        accounts_file = read_configuration('GOOGLE_ACCOUNTS_FILE', '/var/secrets/secrets.env')
+
+        if not accounts_file:
+            return _load_api_client(
+                android_id=read_configuration('ANDROID_ID', '/var/secrets/secrets.env'),
+                username=read_configuration('GOOGLE_USERNAME', '/var/secrets/secrets.env'),
+                password=read_configuration('GOOGLE_PASSWORD', '/var/secrets/secrets.env'),
+                max_workers=max_workers
+            )
+
+        with open(accounts_file) as accounts:
+            clients = [
+                _load_api_client(
+                    android_id=account.get('android_id'),
+                    username=account.get('username'),
+                    password=account.get('password'),
+                    max_workers=max_workers,
+                    token_suffix='.%s' % md5((account.get('username') or '').encode('utf-8')).hexdigest()[:12]
+                ) for account in json.load(accounts)
+            ]
+
+        return ApiClientPool(
+            clients,
+            strategy=read_configuration('ACCOUNT_STRATEGY', '/var/secrets/secrets.env', default='round-robin'),
+            max_login_failures=int(read_configuration(
+                'MAX_ACCOUNT_LOGIN_FAILURES', '/var/secrets/secrets.env', default='3'
+            )),
+            ejection_period=int(read_configuration(
+                'ACCOUNT_EJECTION_PERIOD', '/var/secrets/secrets.env', default='300'
+            )),
+            max_workers=max_workers
         )
 
     elif api_type == 'scraper':
-        return Scraper(cache_max_age=int(
+        cache_max_age = int(
             read_configuration('MAX_CACHE_AGE', '/var/secrets/secrets.env', default=24 * 60 * 60)
+        )
+
+        cache_directory = read_configuration(
+            'SCRAPER_CACHE_DIR', '/var/secrets/secrets.env',
+            default=os.path.join(tempfile.gettempdir(), 'googleplay-proxy-scraper')
+        )
+
+        cache_max_entries = int(read_configuration(
+            'SCRAPER_CACHE_MAX_ENTRIES', '/var/secrets/secrets.env', default='1000'
         ))
 
+        return Scraper(
+            cache_max_age=cache_max_age,
+            max_workers=max_workers,
+            disk_cache=DiskCache(
+                cache_directory,
+                max_entries=cache_max_entries,
+                max_size=int(read_configuration(
+                    'SCRAPER_CACHE_MAX_SIZE', '/var/secrets/secrets.env', default=str(100 * 1024 * 1024)
+                )),
+                max_age=cache_max_age,
+                compress=read_configuration(
+                    'SCRAPER_CACHE_COMPRESS', '/var/secrets/secrets.env', default='true'
+                ).lower() in ('true', 'yes', '1')
+            ),
+            results_cache=DiskCache(
+                os.path.join(cache_directory, 'results'),
+                max_entries=cache_max_entries,
+                max_age=cache_max_age,
+                compress=True
+            ),
+            parser=read_configuration('SCRAPER_PARSER', '/var/secrets/secrets.env', default='html.parser'),
+            partial_parsing=read_configuration(
+                'SCRAPER_PARTIAL_PARSING', '/var/secrets/secrets.env', default='false'
+            ).lower() in ('true', 'yes', '1'),
+            governor=upstream_governor,
+            max_fetch_retries=int(read_configuration('HTTP_MAX_RETRIES', '/var/secrets/secrets.env', default='2')),
+            retry_budget=retry_budget,
+            http_client=HttpClient(
+                pool_size=int(read_configuration(
+                    'HTTP_POOL_SIZE', '/var/secrets/secrets.env', default=max_workers
+                )),
+                connect_timeout=float(read_configuration(
+                    'HTTP_CONNECT_TIMEOUT', '/var/secrets/secrets.env', default='5'
+                )),
+                read_timeout=float(read_configuration(
+                    'HTTP_READ_TIMEOUT', '/var/secrets/secrets.env', default='20'
+                )),
+                use_gzip=read_configuration(
+                    'HTTP_GZIP', '/var/secrets/secrets.env', default='true'
+                ).lower() in ('true', 'yes', '1')
+            )
+        )
+
     else:
         logger.error('Invalid API type "%s" (valid ones are: "api" and "scraper")', os.environ.get('API_TYPE'))
         exit(1)
 
 
-api = load_api()
+def _load_api_client(android_id, username, password, max_workers, token_suffix=''):
+    token_cache_path = read_configuration(
+        'TOKEN_CACHE_PATH', '/var/secrets/secrets.env',
+        default=os.path.join(tempfile.gettempdir(), 'googleplay-proxy-token.json')
+    )
+
+    rate_limit = float(read_configuration('ACCOUNT_RATE_LIMIT', '/var/secrets/secrets.env', default='0'))
+
+    return ApiClient(
+        android_id=android_id,
+        username=username,
+        password=password,
+        max_login_retries=int(read_configuration(
+            'MAX_LOGIN_RETRIES', '/var/secrets/secrets.env', default='10'
+        )),
+        max_workers=max_workers,
+        bulk_details=read_configuration(
+            'BULK_DETAILS', '/var/secrets/secrets.env', default='false'
+        ).lower() in ('true', 'yes', '1'),
+        bulk_chunk_size=int(read_configuration(
+            'BULK_DETAILS_CHUNK_SIZE', '/var/secrets/secrets.env', default='100'
+        )),
+        token_cache_path='%s%s' % (token_cache_path, token_suffix) if token_cache_path else None,
+        token_refresh_interval=int(read_configuration(
+            'TOKEN_REFRESH_INTERVAL', '/var/secrets/secrets.env', default='43200'
+        )),
+        rate_limit=rate_limit or None,
+        rate_limit_burst=int(read_configuration(
+            'ACCOUNT_RATE_LIMIT_BURST', '/var/secrets/secrets.env', default='0'
+        )) or None,
+        governor=upstream_governor,
+        retry_budget=retry_budget
+    )
+
+
+api = None
+_api_pid = None
+_api_lock = Lock()
+
+
+def get_api():
+    """
+    Returns the API client, loading it on first use in each process,
+    so forked server workers do not share its connections, locks and login state.
+    """
+
+    global api, _api_pid
+
+    if api is None or (_api_pid is not None and _api_pid != os.getpid()):
+        with _api_lock:
+            if api is None or (_api_pid is not None and _api_pid != os.getpid()):
+                api = load_api()
+                _api_pid = os.getpid()
+
+    return api
+
+
+max_batch_size = int(read_configuration('MAX_BATCH_SIZE', '/var/secrets/secrets.env', default='200'))
+
+response_encodings = supported_encodings(
+    encoding.strip() for encoding in read_configuration(
+        'RESPONSE_ENCODINGS', '/var/secrets/secrets.env', default=','.join(DEFAULT_ENCODINGS)
+    ).split(',') if encoding.strip()
+)
+
+request_timeout = float(read_configuration('REQUEST_TIMEOUT', '/var/secrets/secrets.env', default='30'))
+
+server_timing_rate = float(read_configuration('SERVER_TIMING_SAMPLE_RATE', '/var/secrets/secrets.env', default='0'))
+
+debug_token = read_configuration('DEBUG_TOKEN', '/var/secrets/secrets.env')
+profiler = SamplingProfiler()
+
+
+@app.before_request
+def _start_request_deadline():
+    deadlines.start(request_timeout)
+
+
+@app.teardown_request
+def _clear_request_deadline(exception):
+    deadlines.clear()
+
+
+@app.before_request
+def _start_request_timing():
+    if server_timing_rate and random.random() < server_timing_rate:
+        g.timing_started_at = time.time()
+        timing.start()
+
+    if request.endpoint != 'profile_requests':
+        profiler.request_started()
+
+
+@app.after_request
+def _add_server_timing(response):
+    timings = timing.stop()
+    started_at = g.get('timing_started_at')
+
+    if timings is not None and started_at is not None:
+        timings['total'] = (time.time() - started_at) * 1000.0
+        response.headers['Server-Timing'] = timing.server_timing(timings)
+
+    return response
+
+
+@app.teardown_request
+def _finish_request_profiling(exception):
+    # `after_request` is skipped when the request fails, do not leak the timings to the next one on this thread
+    timing.stop()
+
+    profiler.request_finished()
+
+
+@app.route('/debug/profile')
+def profile_requests():
+    """
+    Samples the stacks of the next `requests` requests handled by this process
+    and returns them in the folded flame graph format once they finished (or `timeout` passed).
+    Only available when `DEBUG_TOKEN` is set and sent in the `X-Debug-Token` header.
+    """
+
+    if not _has_debug_token():
+        abort(404)
+
+    try:
+        requests = min(int(request.args.get('requests', '10')), 1000)
+        timeout = min(float(request.args.get('timeout', '60')), 600)
+
+    except ValueError:
+        abort(400)
+
+    if requests < 1:
+        abort(400)
+
+    if not profiler.start(requests):
+        abort(409)
+
+    return app.response_class(profiler.wait(timeout), mimetype='text/plain')
+
+
+def _has_debug_token():
+    if not debug_token:
+        return False
+
+    provided, expected = request.headers.get('X-Debug-Token', ''), debug_token
+
+    if isinstance(provided, unicode):
+        provided = provided.encode('utf-8')
+
+    if isinstance(expected, unicode):
+        expected = expected.encode('utf-8')
+
+    return hmac.compare_digest(provided, expected)
+
+
+@app.errorhandler(UpstreamUnavailable)
+def _upstream_unavailable(error):
+    logger.warn('Failed to serve %s: %s', request.path, error)
+
+    response = jsonify(error='Upstream unavailable', reason=error.reason)
+    response.status_code = 503
+
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(int(error.retry_after) + 1)
+
+    return response
+
+
+@app.errorhandler(DeadlineExceeded)
+def _deadline_exceeded(error):
+    logger.warn('Failed to serve %s in %s seconds: %s', request.path, request_timeout, error)
+
+    response = jsonify(error='Upstream timeout')
+    response.status_code = 504
+
+    return response
+
+
+def _is_permanent_error(error):
+    """
+    Returns `True` for the errors that are not expected to change when retried soon,
+    like unknown packages or developers.
+    """
+
+    if isinstance(error, HttpError):
+        return 400 <= error.status < 500 and error.status not in (408, 429)
+
+    return isinstance(error, (RequestError, NotFound))
+
+
+@app.errorhandler(NotFound)
+@app.errorhandler(RequestError)
+@app.errorhandler(HttpError)
+def _upstream_error(error):
+    if _is_permanent_error(error):
+        logger.info('Not found %s: %s', request.path, error)
+
+        response = jsonify(error='Not found')
+        response.status_code = 404
+
+    else:
+        logger.warn('Failed to serve %s: %s', request.path, error)
+
+        response = jsonify(error='Upstream error')
+        response.status_code = 502
+
+    return response
 
 
 @app.route('/search/<package_prefix>')
-@cache.memoize(timeout=3600)
 def search_applications(package_prefix):
-    logger.info('Searching application with package prefix: %s', package_prefix)
-    return jsonify(api.search(package_prefix))
+    if _is_streaming():
+        return _stream(_search, get_api().iter_search, package_prefix)
+
+    return _json_response(_search(package_prefix))
 
 
 @app.route('/developer/<developer_name>')
-@cache.memoize(timeout=3600)
 def search_developer(developer_name):
-    logger.info('Searching application with developer name: %s', developer_name)
-    return jsonify(api.developer(developer_name))
+    if _is_streaming():
+        return _stream(_developer, get_api().iter_developer, developer_name)
+
+    return _json_response(_developer(developer_name))
 
 
 @app.route('/details/<package_name>')
-@cache.memoize(timeout=3600)
 def get_application_details(package_name):
+    return _json_response(_details(package_name))
+
+
+@app.route('/details', methods=['GET', 'POST'])
+def get_application_details_many():
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        package_names = body.get('packages') if isinstance(body, dict) else body
+
+    else:
+        package_names = request.args.get('packages', '').split(',')
+
+    if not isinstance(package_names, list):
+        abort(400)
+
+    package_names = unique(name.strip() for name in package_names
+                           if isinstance(name, basestring) and name.strip())
+
+    if not package_names or len(package_names) > max_batch_size:
+        abort(400)
+
+    results = _details_many(package_names)
+
+    body = join_object((name, results[name].body if results.get(name) else 'null') for name in package_names)
+
+    encoding = _accepted_encoding()
+
+    with timing.measure('serialize'):
+        encoded = encode(body, [encoding] if encoding else [])
+
+    return _json_response(encoded)
+
+
+def _json_response(encoded):
+    """
+    Returns the serialized JSON response in the best encoding the client accepts,
+    with a strong ETag derived from its content, or an empty `304 Not Modified`
+    response if it matches `If-None-Match`.
+    """
+
+    encoding = _accepted_encoding(encoded.variants)
+    data, etag = encoded.encoded(encoding)
+
+    response = app.response_class(data, mimetype='application/json')
+
+    if encoding:
+        response.content_encoding = encoding
+
+    response.vary.add('Accept')
+    response.vary.add('Accept-Encoding')
+
+    response.cache_control.public = True
+    response.cache_control.max_age = response_cache.soft_timeout
+
+    response.set_etag(etag)
+
+    return response.make_conditional(request)
+
+
+def _is_streaming():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+
+def _stream(cached_function, iterate, argument):
+    """
+    Returns a newline delimited JSON response with one item per line, emitting the items
+    as they are extracted, or from the cached response of `cached_function` if there is one.
+    The extracted items are cached as the response of `cached_function` once all of them are streamed.
+    """
+
+    key = response_cache.cache_key(cached_function.cache_name, argument)
+    cached = response_cache.get(key, cached_function.loader, argument)
+
+    if cached is None and not getattr(get_api(), 'streams_incrementally', False):
+        # the API clients fetch all the results at once, load them through the cache to coalesce the requests
+        cached = cached_function(argument)
+
+    if cached is not None:
+        items = iter(json.loads(cached.body))
+
+    else:
+        error = response_cache.get_error(key)
+
+        if error is not None:
+            raise error
+
+        items = iterate(argument)
+
+    # fetch the first item before sending the headers, so upstream failures can still change the status code
+    try:
+        first = next(items, None)
+
+    except Exception as ex:
+        response_cache.remember_error(key, ex)
+        raise
+
+    def generate():
+        streamed = list()
+
+        if first is not None:
+            streamed.append(first)
+            yield serialize(first) + '\n'
+
+            try:
+                for item in items:
+                    streamed.append(item)
+                    yield serialize(item) + '\n'
+
+            except Exception as ex:
+                logger.error('Failed to stream the results for %s: %s', argument, ex)
+                return
+
+        if cached is None:
+            response_cache.set(key, _encode(streamed))
+
+    response = app.response_class(generate(), mimetype='application/x-ndjson')
+    response.vary.add('Accept')
+
+    return response
+
+
+def _accepted_encoding(available=None):
+    candidates = [encoding for encoding in response_encodings if available is None or encoding in available]
+
+    if candidates:
+        return request.accept_encodings.best_match(candidates)
+
+
+@response_cache.cached('search.json')
+def _search(package_prefix):
+    logger.info('Searching application with package prefix: %s', package_prefix)
+    return _encode(get_api().search(package_prefix))
+
+
+@response_cache.cached('developer.json')
+def _developer(developer_name):
+    logger.info('Searching application with developer name: %s', developer_name)
+    return _encode(get_api().developer(developer_name))
+
+
+@response_cache.cached('details.json')
+def _details(package_name):
     logger.info('Fetching application details for package: %s', package_name)
-    return jsonify(api.get_details(package_name))
+
+    details = get_api().get_details(package_name)
+
+    if details is None:
+        raise NotFound('Application not found: %s' % package_name)
+
+    return _encode(details)
+
+
+def _details_many(package_names):
+    """
+    Returns the cached or fetched details of the packages,
+    leaving out the ones not found and the ones that failed to load.
+    """
+
+    results = response_cache.get_many(_details, package_names)
+
+    missing = [name for name in package_names if name not in results and
+               response_cache.get_error(response_cache.cache_key(_details.cache_name, name)) is None]
+
+    if missing:
+        logger.info('Fetching application details for %d packages (%d cached)',
+                    len(missing), len(results))
+
+        failures = dict()
+
+        try:
+            fetched = dict()
+
+            for name, details in get_api().get_details_many(missing, failures).items():
+                if details is None:
+                    response_cache.remember_error(response_cache.cache_key(_details.cache_name, name),
+                                                  NotFound('Application not found: %s' % name))
+
+                else:
+                    fetched[name] = _encode(details)
+
+        except (UpstreamUnavailable, DeadlineExceeded):
+            expired = response_cache.get_many(_details, missing, include_expired=True)
+
+            if len(expired) < len(missing):
+                raise
+
+            logger.warn('Serving expired application details for %d packages', len(expired))
+
+            results.update(expired)
+            return results
+
+        for name, error in failures.items():
+            response_cache.remember_error(response_cache.cache_key(_details.cache_name, name), error)
+
+        response_cache.set_many(_details, fetched)
+
+        results.update(fetched)
+
+    return results
+
+
+def _encode(payload):
+    with timing.measure('serialize'):
+        return encode(serialize(payload), response_encodings)
 
 
 if __name__ == '__main__':  # pragma: no cover
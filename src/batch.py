@@ -0,0 +1,72 @@
+import logging
+from multiprocessing.pool import ThreadPool
+
+import deadlines
+from governor import UpstreamUnavailable
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+
+def unique(items):
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+
+def fetch_many(func, keys, max_workers, failures=None):
+    """
+    Calls `func` for each of the `keys` concurrently using at most `max_workers` threads
+    and returns the results in a dictionary. Keys whose call failed are left out
+    (with their errors added to the `failures` dictionary, if given), unless the upstream service
+    is unavailable, the deadline of the request has passed or the login failed,
+    these errors are raised on the calling thread.
+    """
+
+    keys = unique(keys)
+
+    if not keys:
+        return dict()
+
+    deadline = deadlines.current()
+    errors = list()
+
+    def fetch(key):
+        try:
+            with deadlines.inherited(deadline):
+                return key, func(key), True
+
+        except (UpstreamUnavailable, deadlines.DeadlineExceeded) as ex:
+            errors.append(ex)
+            return key, None, False
+
+        except Exception as ex:
+            logger.warn('Failed to fetch %s: %s', key, ex)
+
+            if failures is not None:
+                failures[key] = ex
+
+            return key, None, False
+
+        except BaseException as ex:
+            # like `ApiLoginException`, it would kill the pool's worker thread and block `map` forever
+            errors.append(ex)
+            return key, None, False
+
+    if len(keys) == 1 or max_workers <= 1:
+        results = map(fetch, keys)
+
+    else:
+        pool = ThreadPool(min(max_workers, len(keys)))
+
+        try:
+            results = pool.map(fetch, keys)
+
+        finally:
+            pool.close()
+            pool.join()
+
+    if errors:
+        raise errors[0]
+
+    return {key: result for key, result, success in results if success}
@@ -0,0 +1,408 @@
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock, Thread
+from urllib import quote_plus
+from Queue import Queue, Full
+
+from docker_helper import read_configuration
+from prometheus_client import Counter
+
+from deadlines import DeadlineExceeded
+from governor import UpstreamUnavailable
+import timing
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+CACHE_REQUESTS = Counter(
+    'googleplay_response_cache_requests_total', 'Response cache lookups per cached function', ['cache', 'result']
+)
+
+
+CACHE_TYPES = ('simple', 'filesystem', 'redis', 'memcached', 'null')
+
+
+def cache_configuration():
+    cache_type = read_configuration('CACHE_TYPE', '/var/secrets/secrets.env', default='simple')
+
+    if cache_type not in CACHE_TYPES:
+        raise ValueError('Invalid cache type "%s" (valid ones are: %s)' %
+                         (cache_type, ', '.join('"%s"' % valid for valid in CACHE_TYPES)))
+
+    config = {
+        'CACHE_TYPE': cache_type,
+        'CACHE_DEFAULT_TIMEOUT': int(read_configuration(
+            'CACHE_DEFAULT_TIMEOUT', '/var/secrets/secrets.env', default='3600'
+        )),
+        'CACHE_THRESHOLD': int(read_configuration(
+            'CACHE_THRESHOLD', '/var/secrets/secrets.env', default='500'
+        )),
+        'CACHE_KEY_PREFIX': read_configuration(
+            'CACHE_KEY_PREFIX', '/var/secrets/secrets.env', default='googleplay-proxy:'
+        ),
+        'CACHE_NO_NULL_WARNING': True
+    }
+
+    if cache_type == 'filesystem':
+        config['CACHE_DIR'] = read_configuration(
+            'CACHE_DIR', '/var/secrets/secrets.env',
+            default=os.path.join(tempfile.gettempdir(), 'googleplay-proxy-cache')
+        )
+
+    elif cache_type == 'redis':
+        config['CACHE_REDIS_URL'] = read_configuration(
+            'CACHE_REDIS_URL', '/var/secrets/secrets.env', default='redis://localhost:6379/0'
+        )
+
+    elif cache_type == 'memcached':
+        config['CACHE_MEMCACHED_SERVERS'] = read_configuration(
+            'CACHE_MEMCACHED_SERVERS', '/var/secrets/secrets.env', default='127.0.0.1:11211'
+        ).split(',')
+
+    return config
+
+
+def create_negative_cache(is_permanent):
+    timeout = int(read_configuration('NEGATIVE_CACHE_TIMEOUT', '/var/secrets/secrets.env', default='300'))
+
+    if timeout <= 0:
+        return None
+
+    return NegativeCache(
+        is_permanent,
+        timeout=timeout,
+        max_entries=int(read_configuration(
+            'NEGATIVE_CACHE_MAX_ENTRIES', '/var/secrets/secrets.env', default='10000'
+        ))
+    )
+
+
+def create_response_cache(cache, negative_cache=None):
+    soft_timeout = int(read_configuration(
+        'CACHE_SOFT_TIMEOUT', '/var/secrets/secrets.env',
+        default=read_configuration('CACHE_DEFAULT_TIMEOUT', '/var/secrets/secrets.env', default='3600')
+    ))
+
+    return ResponseCache(
+        cache,
+        soft_timeout=soft_timeout,
+        hard_timeout=int(read_configuration(
+            'CACHE_HARD_TIMEOUT', '/var/secrets/secrets.env', default=soft_timeout
+        )),
+        refresh_workers=int(read_configuration(
+            'CACHE_REFRESH_WORKERS', '/var/secrets/secrets.env', default='2'
+        )),
+        stale_if_error=int(read_configuration(
+            'CACHE_STALE_IF_ERROR', '/var/secrets/secrets.env', default='0'
+        )),
+        negative_cache=negative_cache
+    )
+
+
+class NegativeCache(object):
+    """
+    Remembers the errors `is_permanent` returns `True` for (like unknown packages)
+    for `timeout` seconds in the process, so the same failing lookups are not repeated.
+    Keeps at most `max_entries` errors, dropping the oldest ones first.
+    """
+
+    def __init__(self, is_permanent, timeout=300, max_entries=10000):
+        self.timeout = timeout
+        self.max_entries = max_entries
+
+        self._is_permanent = is_permanent
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            error, expires_at = entry
+
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+
+            return error
+
+    def set(self, key, error):
+        """
+        Remembers the `error` for the `key` if it is permanent, returns `True` if it was.
+        """
+
+        if not self._is_permanent(error):
+            return False
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (error, time.time() + self.timeout)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return True
+
+
+class ResponseCache(object):
+    """
+    Caches the results of the wrapped functions with a soft and a hard timeout.
+
+    Entries older than the soft timeout are still served (until the hard timeout)
+    while they are being refreshed in the background.
+    Expired entries are kept for another `stale_if_error` seconds to be served
+    when they can not be loaded because the upstream is unavailable or too slow.
+    Permanent errors of the loads are remembered in the `negative_cache` (if given)
+    and raised again without loading until they expire.
+    """
+
+    def __init__(self, cache, soft_timeout=3600, hard_timeout=None,
+                 refresh_workers=2, max_pending_refreshes=100, stale_if_error=0, negative_cache=None):
+
+        self._cache = cache
+        self._soft_timeout = soft_timeout
+        self._hard_timeout = max(hard_timeout or soft_timeout, soft_timeout)
+        self._stale_if_error = stale_if_error
+        self._negative_cache = negative_cache
+
+        self._refresh_workers = refresh_workers
+        self._refresh_queue = Queue(maxsize=max_pending_refreshes)
+        self._refreshing = set()
+        self._lock = Lock()
+        self._workers = list()
+
+    @property
+    def soft_timeout(self):
+        return self._soft_timeout
+
+    def cached(self, name):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args):
+                return self.get_or_load(self.cache_key(name, *args), func, *args)
+
+            wrapper.cache_name = name
+            wrapper.loader = func
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def cache_key(name, *args):
+        return ':'.join([name] + [quote_plus(arg.encode('utf-8') if isinstance(arg, unicode) else str(arg))
+                                  for arg in args])
+
+    def get_or_load(self, key, loader, *args):
+        with timing.measure('cache'):
+            entry = self._cache.get(key)
+
+        if entry is not None:
+            value, created_at = entry
+
+            if self._is_expired(created_at):
+                return self._load_or_expired(key, value, loader, args)
+
+            if time.time() >= created_at + self._soft_timeout:
+                self._record(key, 'stale')
+                self._schedule_refresh(key, loader, args)
+
+            else:
+                self._record(key, 'hit')
+
+            return value
+
+        error = self.get_error(key)
+
+        if error is not None:
+            raise error
+
+        self._record(key, 'miss')
+
+        return self.load(key, loader, *args)
+
+    def _load_or_expired(self, key, expired_value, loader, args):
+        try:
+            value = self.load(key, loader, *args)
+
+        except (UpstreamUnavailable, DeadlineExceeded) as ex:
+            logger.warn('Serving expired cache entry for %s: %s', key, ex)
+
+            self._record(key, 'expired')
+            return expired_value
+
+        self._record(key, 'miss')
+        return value
+
+    def load(self, key, loader, *args):
+        try:
+            value = loader(*args)
+
+        except Exception as ex:
+            self.remember_error(key, ex)
+            raise
+
+        self.set(key, value)
+        return value
+
+    def get_error(self, key):
+        """
+        Returns the permanent error remembered for the `key`, if any.
+        """
+
+        if self._negative_cache is None:
+            return None
+
+        error = self._negative_cache.get(key)
+
+        if error is not None:
+            self._record(key, 'negative')
+
+        return error
+
+    def remember_error(self, key, error):
+        if self._negative_cache is not None and self._negative_cache.set(key, error):
+            logger.info('Remembering the failed lookup of %s: %s', key, error)
+
+    def get(self, key, loader=None, *args):
+        """
+        Returns the value cached for the `key` unless it has expired,
+        refreshing it with the `loader` in the background when it is stale.
+        """
+
+        with timing.measure('cache'):
+            entry = self._cache.get(key)
+
+        if entry is None or self._is_expired(entry[1]):
+            self._record(key, 'miss')
+            return None
+
+        value, created_at = entry
+
+        if time.time() >= created_at + self._soft_timeout:
+            self._record(key, 'stale')
+
+            if loader is not None:
+                self._schedule_refresh(key, loader, args)
+
+        else:
+            self._record(key, 'hit')
+
+        return value
+
+    def set(self, key, value):
+        self._cache.set(key, (value, time.time()), timeout=self._storage_timeout)
+
+    def get_many(self, cached_function, args, include_expired=False):
+        """
+        Looks up the results of a single-argument cached function for each of the `args`
+        and returns the ones found in a dictionary.
+        Expired entries are only included with `include_expired`,
+        to be served when the upstream is unavailable.
+        """
+
+        keys = [self.cache_key(cached_function.cache_name, arg) for arg in args]
+        results = dict()
+
+        with timing.measure('cache'):
+            entries = self._cache.get_many(*keys)
+
+        for arg, key, entry in zip(args, keys, entries):
+            if entry is None:
+                self._record(key, 'miss')
+                continue
+
+            value, created_at = entry
+
+            if self._is_expired(created_at):
+                if not include_expired:
+                    self._record(key, 'miss')
+                    continue
+
+                self._record(key, 'expired')
+
+            elif time.time() >= created_at + self._soft_timeout:
+                self._record(key, 'stale')
+                self._schedule_refresh(key, cached_function.loader, (arg,))
+
+            else:
+                self._record(key, 'hit')
+
+            results[arg] = value
+
+        return results
+
+    def set_many(self, cached_function, values):
+        now = time.time()
+
+        self._cache.set_many({
+            self.cache_key(cached_function.cache_name, arg): (value, now)
+            for arg, value in values.items()
+        }, timeout=self._storage_timeout)
+
+    def join(self):
+        self._refresh_queue.join()
+
+    @property
+    def _storage_timeout(self):
+        return self._hard_timeout + self._stale_if_error
+
+    def _is_expired(self, created_at):
+        return time.time() >= created_at + self._hard_timeout
+
+    @staticmethod
+    def _record(key, result):
+        CACHE_REQUESTS.labels(key.split(':', 1)[0], result).inc()
+
+    def _schedule_refresh(self, key, loader, args):
+        with self._lock:
+            if key in self._refreshing:
+                return
+
+            self._start_workers()
+
+            try:
+                self._refresh_queue.put_nowait((key, loader, args))
+                self._refreshing.add(key)
+
+            except Full:
+                logger.warn('Too many pending refreshes, serving stale entry for %s', key)
+
+    def _start_workers(self):
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+
+        for _ in range(self._refresh_workers - len(self._workers)):
+            worker = Thread(target=self._process_refreshes, name='cache-refresh')
+            worker.daemon = True
+            worker.start()
+
+            self._workers.append(worker)
+
+    def _process_refreshes(self):
+        while True:
+            key, loader, args = self._refresh_queue.get()
+
+            try:
+                logger.info('Refreshing stale cache entry: %s', key)
+                self.load(key, loader, *args)
+
+            except Exception as ex:
+                logger.warn('Failed to refresh cache entry %s: %s', key, ex)
+
+            except BaseException as ex:
+                # like `ApiLoginException`, keep the worker alive for the following refreshes
+                logger.warn('Failed to refresh cache entry %s: %s', key, ex)
+
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+                self._refresh_queue.task_done()
@@ -0,0 +1,81 @@
+from functools import wraps
+from threading import Event, Lock
+
+import deadlines
+
+
+def coalesced(method):
+    """
+    Lets only one call of the wrapped method run per distinct argument list at a time,
+    concurrent callers with the same arguments wait for and receive its result.
+    The instance is expected to have a `SingleFlight` as `_single_flight`.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args):
+        return self._single_flight.do((method.__name__,) + args, method, self, *args)
+
+    return wrapper
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = dict()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+
+            if call is not None:
+                call.waiters += 1
+                leader = False
+
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            if not call.done.wait(deadlines.timeout()):
+                raise deadlines.DeadlineExceeded('Request deadline exceeded while waiting for %s' % (key,))
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+
+        except BaseException as ex:
+            call.error = ex
+            raise
+
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def waiting(self, key):
+        """
+        Returns the number of callers waiting for the result of the call in flight for the `key`.
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+
+            return call.waiters if call is not None else 0
@@ -0,0 +1,105 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+_POLL_INTERVAL = 0.05
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the time allowed for the current request has run out.
+    """
+
+    pass
+
+
+def start(seconds):
+    """
+    Sets the deadline of the current request on this thread to `seconds` from now
+    (no deadline if not set).
+    """
+
+    _local.deadline = time.time() + seconds if seconds else None
+
+
+def clear():
+    _local.deadline = None
+
+
+def current():
+    """
+    Returns the deadline of the current request as a timestamp, or `None` if there is none.
+    """
+
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def inherited(deadline):
+    """
+    Applies the `deadline` taken from another thread with `current()`
+    to the work done in the block on this thread.
+    """
+
+    previous = current()
+    _local.deadline = deadline
+
+    try:
+        yield
+
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """
+    Returns the number of seconds left until the deadline, or `None` if there is none.
+    """
+
+    deadline = current()
+
+    if deadline is not None:
+        return max(0.0, deadline - time.time())
+
+
+def check():
+    """
+    Raises `DeadlineExceeded` if the deadline has passed.
+    """
+
+    if remaining() == 0:
+        raise DeadlineExceeded('Request deadline exceeded')
+
+
+def timeout(default=None):
+    """
+    Returns the `default` timeout in seconds shortened to the time left until the deadline,
+    or raises `DeadlineExceeded` if it has passed already.
+    """
+
+    left = remaining()
+
+    if left is None:
+        return default
+
+    if left == 0:
+        raise DeadlineExceeded('Request deadline exceeded')
+
+    return left if default is None else min(default, left)
+
+
+def acquire(try_acquire, message='Request deadline exceeded'):
+    """
+    Calls `try_acquire` repeatedly until it returns `True`,
+    or raises `DeadlineExceeded` with the `message` if the deadline passes first.
+    """
+
+    while not try_acquire():
+        left = remaining()
+
+        if left == 0:
+            raise DeadlineExceeded(message)
+
+        time.sleep(_POLL_INTERVAL if left is None else min(_POLL_INTERVAL, left))
@@ -0,0 +1,222 @@
+import logging
+import os
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from hashlib import md5
+from threading import Lock
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+
+class _Entry(object):
+    __slots__ = ('filename', 'size', 'created_at')
+
+    def __init__(self, filename, size, created_at):
+        self.filename = filename
+        self.size = size
+        self.created_at = created_at
+
+
+class DiskCache(object):
+    """
+    A size and entry count bounded cache storing the values in files in `directory`.
+
+    An in-memory index of the stored files is kept in least-recently-used order,
+    lookups missing it check the filesystem for files stored by other processes sharing the directory.
+    Values are written to a temporary file first and renamed into place.
+    """
+
+    PLAIN_EXTENSION = '.cache'
+    COMPRESSED_EXTENSION = '.cache.z'
+
+    def __init__(self, directory, max_entries=1000, max_size=100 * 1024 * 1024, max_age=None, compress=False):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compress = compress
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._index = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        entries = list()
+
+        for filename in os.listdir(self.directory):
+            if filename.startswith('.tmp-'):
+                # left behind by an interrupted write
+                self._remove_file(_Entry(filename, 0, 0))
+                continue
+
+            if not filename.endswith(self.PLAIN_EXTENSION) and not filename.endswith(self.COMPRESSED_EXTENSION):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+
+            except OSError:
+                continue
+
+            entries.append(_Entry(filename, stat.st_size, stat.st_mtime))
+
+        with self._lock:
+            for entry in sorted(entries, key=lambda item: item.created_at):
+                hashed = self._hashed(entry.filename)
+                previous = self._index.pop(hashed, None)
+
+                if previous is not None:
+                    self._size -= previous.size
+                    self._remove_file(previous)
+
+                self._add(hashed, entry)
+
+            self._evict()
+
+    @staticmethod
+    def _hashed(filename):
+        return filename.split('.', 1)[0]
+
+    @staticmethod
+    def _hash(key):
+        hashed = md5()
+        hashed.update(key.encode('utf-8') if isinstance(key, unicode) else key)
+        return hashed.hexdigest()
+
+    def get(self, key):
+        hashed = self._hash(key)
+
+        with self._lock:
+            entry = self._index.pop(hashed, None)
+
+            if entry is None:
+                entry = self._find_file(hashed)
+
+            if entry is None or self._is_expired(entry):
+                if entry is not None:
+                    self._size -= entry.size
+                    self._remove_file(entry)
+
+                self.misses += 1
+                return None
+
+            self._index[hashed] = entry
+            self._evict()
+
+        try:
+            with open(os.path.join(self.directory, entry.filename), 'rb') as cache_file:
+                data = cache_file.read()
+
+        except (IOError, OSError):
+            with self._lock:
+                if self._index.get(hashed) is entry:
+                    self._size -= self._index.pop(hashed).size
+
+                self.misses += 1
+
+            return None
+
+        with self._lock:
+            self.hits += 1
+
+        if entry.filename.endswith(self.COMPRESSED_EXTENSION):
+            return zlib.decompress(data)
+
+        return data
+
+    def set(self, key, data):
+        hashed = self._hash(key)
+
+        if self.compress:
+            filename, stored = hashed + self.COMPRESSED_EXTENSION, zlib.compress(data)
+
+        else:
+            filename, stored = hashed + self.PLAIN_EXTENSION, data
+
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                cache_file.write(stored)
+
+            os.rename(temporary_path, os.path.join(self.directory, filename))
+
+        except (IOError, OSError) as ex:
+            logger.warn('Failed to write cache file %s: %s', filename, ex)
+
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+            return
+
+        with self._lock:
+            previous = self._index.pop(hashed, None)
+
+            if previous is not None:
+                self._size -= previous.size
+
+                if previous.filename != filename:
+                    self._remove_file(previous)
+
+            self._add(hashed, _Entry(filename, len(stored), time.time()))
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'size': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def _find_file(self, hashed):
+        for extension in (self.COMPRESSED_EXTENSION, self.PLAIN_EXTENSION):
+            filename = hashed + extension
+
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+
+            except OSError:
+                continue
+
+            self._size += stat.st_size
+
+            return _Entry(filename, stat.st_size, stat.st_mtime)
+
+    def _is_expired(self, entry):
+        return self.max_age is not None and time.time() >= entry.created_at + self.max_age
+
+    def _add(self, hashed, entry):
+        self._index[hashed] = entry
+        self._size += entry.size
+
+    def _evict(self):
+        while self._index and (len(self._index) > self.max_entries or self._size > self.max_size):
+            _, entry = self._index.popitem(last=False)
+
+            self._size -= entry.size
+            self.evictions += 1
+
+            self._remove_file(entry)
+
+    def _remove_file(self, entry):
+        try:
+            os.remove(os.path.join(self.directory, entry.filename))
+
+        except OSError:
+            pass
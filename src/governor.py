@@ -0,0 +1,261 @@
+import logging
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from docker_helper import read_configuration
+from prometheus_client import Counter, Gauge, Histogram
+
+from ratelimit import TokenBucket
+import deadlines
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+CIRCUIT_STATE = Gauge(
+    'googleplay_upstream_circuit_state', 'State of the upstream circuit breaker (0: closed, 1: half-open, 2: open)',
+    multiprocess_mode='max'
+)
+WAITING_CALLS = Gauge(
+    'googleplay_upstream_waiting_calls', 'Upstream calls waiting for the rate limit',
+    multiprocess_mode='livesum'
+)
+WAIT_DURATION = Histogram(
+    'googleplay_upstream_wait_duration_seconds', 'Time spent waiting for the rate limit before the upstream calls'
+)
+REJECTED_CALLS = Counter(
+    'googleplay_upstream_rejected_total', 'Upstream calls rejected without being sent', ['reason']
+)
+FAILED_CALLS = Counter(
+    'googleplay_upstream_failures_total', 'Upstream calls counted as failures by the circuit breaker'
+)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half-open', 'open'
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def create_upstream_governor():
+    rate_limit = float(read_configuration('UPSTREAM_RATE_LIMIT', '/var/secrets/secrets.env', default='0'))
+
+    return UpstreamGovernor(
+        rate_limit=rate_limit or None,
+        rate_limit_burst=int(read_configuration(
+            'UPSTREAM_RATE_LIMIT_BURST', '/var/secrets/secrets.env', default='0'
+        )) or None,
+        max_waiting=int(read_configuration('UPSTREAM_MAX_WAITING', '/var/secrets/secrets.env', default='100')),
+        max_wait=float(read_configuration('UPSTREAM_MAX_WAIT', '/var/secrets/secrets.env', default='10')),
+        failure_threshold=int(read_configuration(
+            'UPSTREAM_FAILURE_THRESHOLD', '/var/secrets/secrets.env', default='5'
+        )) or None,
+        reset_timeout=float(read_configuration(
+            'UPSTREAM_CIRCUIT_RESET_TIMEOUT', '/var/secrets/secrets.env', default='30'
+        ))
+    )
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling the upstream service when it is considered unhealthy
+    or it could not be called within the allowed waiting time.
+    """
+
+    def __init__(self, reason, retry_after=None):
+        super(UpstreamUnavailable, self).__init__('Upstream unavailable: %s' % reason)
+
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(object):
+    """
+    Opens after `failure_threshold` consecutive failures and rejects the calls
+    for `reset_timeout` seconds, then lets a single trial call through
+    to decide whether to close again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.time() >= self._opened_at + self.reset_timeout:
+                return HALF_OPEN
+
+            return self._state
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self._opened_at + self.reset_timeout - time.time())
+
+    def allow(self):
+        with self._lock:
+            if self._state == OPEN:
+                if time.time() < self._opened_at + self.reset_timeout:
+                    return False
+
+                self._transition(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+
+                self._trial_in_flight = True
+
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def cancel(self):
+        """
+        Releases the trial call of the half-open state without deciding on its outcome.
+        """
+
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.time()
+                self._transition(OPEN)
+
+    def _transition(self, state):
+        logger.warn('Upstream circuit breaker is now %s (after %d failures)', state, self._failures)
+
+        self._state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state])
+
+
+class UpstreamGovernor(object):
+    """
+    Guards the calls to the upstream service shared by all the clients of the process:
+    limits them to `rate_limit` calls per second (if set), lets at most `max_waiting` calls
+    wait up to `max_wait` seconds (or until the request deadline) for the rate limit, and fails fast
+    with `UpstreamUnavailable` while the circuit breaker is open (if `failure_threshold` is set).
+    """
+
+    def __init__(self, rate_limit=None, rate_limit_burst=None, max_waiting=100, max_wait=10.0,
+                 failure_threshold=None, reset_timeout=30):
+
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+
+        if rate_limit:
+            self._rate_limiter = TokenBucket(rate_limit, rate_limit_burst)
+        else:
+            self._rate_limiter = None
+
+        if failure_threshold:
+            self._circuit_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        else:
+            self._circuit_breaker = None
+
+        self._lock = Lock()
+        self._waiting = 0
+
+    @property
+    def state(self):
+        return self._circuit_breaker.state if self._circuit_breaker is not None else CLOSED
+
+    @contextmanager
+    def permit(self, is_failure=None):
+        """
+        Waits for the permission to call the upstream service in the block,
+        and records its outcome for the circuit breaker.
+        Exceptions raised in the block count as failures unless `is_failure` returns `False` for them,
+        running out of the request deadline does not count either way.
+        """
+
+        self._wait_for_rate_limit()
+
+        if self._circuit_breaker is not None and not self._circuit_breaker.allow():
+            REJECTED_CALLS.labels('circuit_open').inc()
+            raise UpstreamUnavailable('circuit open', retry_after=self._circuit_breaker.retry_after())
+
+        try:
+            yield
+
+        except deadlines.DeadlineExceeded:
+            if self._circuit_breaker is not None:
+                self._circuit_breaker.cancel()
+
+            raise
+
+        except Exception as ex:
+            if is_failure is None or is_failure(ex):
+                FAILED_CALLS.inc()
+                self._record(failed=True)
+
+            else:
+                self._record(failed=False)
+
+            raise
+
+        else:
+            self._record(failed=False)
+
+    def _record(self, failed):
+        if self._circuit_breaker is None:
+            return
+
+        if failed:
+            self._circuit_breaker.record_failure()
+
+        else:
+            self._circuit_breaker.record_success()
+
+    def _wait_for_rate_limit(self):
+        if self._rate_limiter is None or self._rate_limiter.try_acquire():
+            return
+
+        if self._circuit_breaker is not None and self._circuit_breaker.state == OPEN:
+            REJECTED_CALLS.labels('circuit_open').inc()
+            raise UpstreamUnavailable('circuit open', retry_after=self._circuit_breaker.retry_after())
+
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                REJECTED_CALLS.labels('queue_full').inc()
+                raise UpstreamUnavailable('too many waiting calls', retry_after=self._rate_limiter.wait_time())
+
+            self._waiting += 1
+
+        WAITING_CALLS.inc()
+
+        try:
+            max_wait = deadlines.timeout(self.max_wait)
+
+            with WAIT_DURATION.time():
+                acquired = self._rate_limiter.acquire(timeout=max_wait)
+
+        finally:
+            WAITING_CALLS.dec()
+
+            with self._lock:
+                self._waiting -= 1
+
+        if not acquired:
+            REJECTED_CALLS.labels('wait_timeout').inc()
+
+            if max_wait < self.max_wait:
+                raise deadlines.DeadlineExceeded('Request deadline exceeded while waiting for the rate limit')
+
+            raise UpstreamUnavailable('rate limit wait timed out', retry_after=self._rate_limiter.wait_time())
@@ -0,0 +1,84 @@
+"""
+Configuration for running the application with Gunicorn:
+
+    gunicorn --config gunicorn_config.py app:app
+"""
+
+import logging
+import multiprocessing
+import os
+
+from docker_helper import read_configuration
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+bind = '%s:%s' % (
+    read_configuration('HTTP_HOST', '/var/secrets/secrets.env', default='127.0.0.1'),
+    read_configuration('HTTP_PORT', '/var/secrets/secrets.env', default='5000')
+)
+
+workers = int(read_configuration('HTTP_WORKERS', '/var/secrets/secrets.env', default=multiprocessing.cpu_count()))
+threads = int(read_configuration('HTTP_THREADS', '/var/secrets/secrets.env', default='8'))
+
+worker_class = read_configuration(
+    'HTTP_WORKER_CLASS', '/var/secrets/secrets.env', default='gthread' if threads > 1 else 'sync'
+)
+
+if worker_class == 'gevent':
+    # patch the standard library before the application is loaded, so the upstream
+    # requests of the API clients and the scraper yield to the other requests
+    # instead of blocking a thread while waiting for the response
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    worker_connections = int(read_configuration(
+        'HTTP_WORKER_CONNECTIONS', '/var/secrets/secrets.env', default='1000'
+    ))
+
+timeout = int(read_configuration('HTTP_WORKER_TIMEOUT', '/var/secrets/secrets.env', default='60'))
+
+if timeout and float(read_configuration('REQUEST_TIMEOUT', '/var/secrets/secrets.env', default='30')) >= timeout:
+    logger.warn('The request timeout is not shorter than the worker timeout of %d seconds, '
+                'slow requests will restart the workers instead of failing', timeout)
+
+# load the application once in the master process and share its memory with the workers,
+# the API clients are only created after the fork, in each worker
+preload_app = read_configuration(
+    'HTTP_PRELOAD_APP', '/var/secrets/secrets.env', default='true'
+).lower() in ('true', 'yes', '1')
+
+if workers > 1 and read_configuration('CACHE_TYPE', '/var/secrets/secrets.env', default='simple') == 'simple':
+    logger.warn('The simple cache is not shared between the %d workers, '
+                'consider using the filesystem, redis or memcached caches', workers)
+
+
+def on_starting(server):
+    directory = os.environ.get('prometheus_multiproc_dir')
+
+    if not directory:
+        return
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # the metrics left behind by the previous run would be added to the new ones
+    for filename in os.listdir(directory):
+        if filename.endswith('.db'):
+            os.remove(os.path.join(directory, filename))
+
+
+def post_worker_init(worker):
+    from app import get_api
+
+    # fail early in the worker if the API can not be loaded
+    get_api()
+
+
+def child_exit(server, worker):
+    if os.environ.get('prometheus_multiproc_dir'):
+        from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics
+
+        GunicornInternalPrometheusMetrics.mark_process_dead_on_child_exit(worker.pid)
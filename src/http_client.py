@@ -0,0 +1,140 @@
+import logging
+import socket
+import zlib
+from httplib import HTTPConnection, HTTPSConnection, HTTPException
+from urlparse import urljoin, urlsplit
+from Queue import Queue, Empty, Full
+
+import deadlines
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+
+class HttpError(Exception):
+    def __init__(self, url, status, reason=None):
+        super(HttpError, self).__init__('HTTP %s %s for %s' % (status, reason or '', url))
+
+        self.url = url
+        self.status = status
+
+
+class HttpClient(object):
+    """
+    A simple HTTP client keeping up to `pool_size` idle keep-alive connections per host.
+    The timeouts are shortened to the time left until the deadline of the current request.
+    """
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, pool_size=4, connect_timeout=5.0, read_timeout=20.0, use_gzip=True, user_agent=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.use_gzip = use_gzip
+        self.user_agent = user_agent
+
+        self._pools = dict()
+
+    def get(self, url):
+        for _ in xrange(self.MAX_REDIRECTS + 1):
+            status, reason, headers, data = self._request(url)
+
+            if status in (301, 302, 303, 307, 308) and headers.get('location'):
+                url = urljoin(url, headers.get('location'))
+                continue
+
+            if status >= 400:
+                raise HttpError(url, status, reason)
+
+            if headers.get('content-encoding') == 'gzip':
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+            return data
+
+        raise HttpError(url, status, 'Too many redirects')
+
+    def close(self):
+        for pool in self._pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+
+                except Empty:
+                    break
+
+    def _request(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+
+        path = parts.path or '/'
+
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+
+        headers = {'Host': parts.netloc, 'Connection': 'keep-alive'}
+
+        if self.use_gzip:
+            headers['Accept-Encoding'] = 'gzip'
+
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+
+        while True:
+            connection, reused = self._acquire(key)
+
+            try:
+                connection.sock.settimeout(deadlines.timeout(self.read_timeout))
+                connection.request('GET', path, headers=headers)
+
+                response = connection.getresponse()
+                data = response.read()
+
+            except (socket.error, HTTPException):
+                connection.close()
+
+                if reused:
+                    # the server has probably closed the idle connection, retry on a new one
+                    continue
+
+                deadlines.check()
+                raise
+
+            if response.will_close:
+                connection.close()
+
+            else:
+                self._release(key, connection)
+
+            return response.status, response.reason, dict(response.getheaders()), data
+
+    def _pool(self, key):
+        pool = self._pools.get(key)
+
+        if pool is None:
+            pool = self._pools.setdefault(key, Queue(maxsize=self.pool_size))
+
+        return pool
+
+    def _acquire(self, key):
+        try:
+            return self._pool(key).get_nowait(), True
+
+        except Empty:
+            return self._connect(*key), False
+
+    def _release(self, key, connection):
+        try:
+            self._pool(key).put_nowait(connection)
+
+        except Full:
+            connection.close()
+
+    def _connect(self, scheme, host, port):
+        connection_class = HTTPSConnection if scheme == 'https' else HTTPConnection
+
+        connection = connection_class(host, port, timeout=deadlines.timeout(self.connect_timeout))
+        connection.connect()
+
+        return connection
@@ -0,0 +1,184 @@
+import logging
+import time
+from threading import Lock
+
+from api import ApiLoginException
+from batch import fetch_many, unique
+from coalescing import coalesced, SingleFlight
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+
+STRATEGIES = ('round-robin', 'least-loaded')
+
+
+class _Account(object):
+    def __init__(self, index, client):
+        self.index = index
+        self.client = client
+
+        self.in_flight = 0
+        self.login_failures = 0
+        self.ejected_until = 0
+
+    def is_available(self, now):
+        return self.ejected_until <= now
+
+
+class ApiClientPool(object):
+    """
+    Dispatches calls to a pool of `ApiClient` instances logged in with different accounts.
+    Accounts failing to log in `max_login_failures` times in a row
+    are left out for `ejection_period` seconds.
+    """
+
+    def __init__(self, clients, strategy='round-robin', max_login_failures=3, ejection_period=300,
+                 max_workers=8):
+
+        if not clients:
+            raise ValueError('At least one client is required')
+
+        if strategy not in STRATEGIES:
+            raise ValueError('Invalid strategy "%s" (valid ones are: %s)' %
+                             (strategy, ', '.join('"%s"' % valid for valid in STRATEGIES)))
+
+        self._accounts = [_Account(index, client) for index, client in enumerate(clients)]
+        self._strategy = strategy
+        self._max_login_failures = max_login_failures
+        self._ejection_period = ejection_period
+        self._max_workers = max_workers
+
+        self._lock = Lock()
+        self._next_index = 0
+
+        # the clients only coalesce their own calls, but identical calls may go to different accounts
+        self._single_flight = SingleFlight()
+
+    def is_logged_in(self):
+        return any(account.client.is_logged_in() for account in self._accounts)
+
+    def login(self):
+        last_error = None
+
+        for account in self._accounts:
+            try:
+                account.client.login()
+                self._record_success(account)
+
+            except ApiLoginException as err:
+                last_error = err
+                self._record_login_failure(account)
+
+        if not self.is_logged_in():
+            raise ApiLoginException(last_error)
+
+    def available_accounts(self):
+        now = time.time()
+        return sum(1 for account in self._accounts if account.is_available(now))
+
+    @coalesced
+    def search(self, package_prefix):
+        return self._dispatch('search', package_prefix)
+
+    @coalesced
+    def developer(self, developer_name):
+        return self._dispatch('developer', developer_name)
+
+    def iter_search(self, package_prefix):
+        # the accounts are released after the call, the API returns all the results at once anyway
+        return iter(self.search(package_prefix))
+
+    def iter_developer(self, developer_name):
+        return iter(self.developer(developer_name))
+
+    @coalesced
+    def get_details(self, package_name):
+        return self._dispatch('get_details', package_name)
+
+    def get_details_many(self, package_names, failures=None):
+        package_names = unique(package_names)
+
+        accounts = max(1, self.available_accounts())
+        chunk_size = max(1, -(-len(package_names) // accounts))
+
+        chunks = [tuple(package_names[idx:idx + chunk_size])
+                  for idx in xrange(0, len(package_names), chunk_size)]
+
+        results = dict()
+
+        for chunk_results in fetch_many(lambda chunk: self._dispatch('get_details_many', list(chunk), failures),
+                                        chunks, self._max_workers).values():
+            results.update(chunk_results)
+
+        return results
+
+    def _dispatch(self, method_name, *args):
+        tried = set()
+        last_error = None
+
+        while True:
+            account = self._acquire(tried)
+
+            if account is None:
+                logger.error('No accounts available for %s', method_name)
+                raise ApiLoginException(last_error or 'No accounts available')
+
+            tried.add(account)
+
+            try:
+                result = getattr(account.client, method_name)(*args)
+                self._record_success(account)
+                return result
+
+            except ApiLoginException as err:
+                last_error = err
+                self._record_login_failure(account)
+
+            finally:
+                self._release(account)
+
+    def _acquire(self, excluded):
+        now = time.time()
+
+        with self._lock:
+            candidates = [account for account in self._accounts
+                          if account not in excluded and account.is_available(now)]
+
+            if not candidates:
+                return None
+
+            if self._strategy == 'least-loaded':
+                candidates.sort(key=lambda account: account.in_flight)
+
+            else:
+                start = self._next_index % len(self._accounts)
+                candidates.sort(key=lambda account: (account.index - start) % len(self._accounts))
+
+            account = next((account for account in candidates if account.client.has_capacity()),
+                           candidates[0])
+
+            account.in_flight += 1
+            self._next_index = account.index + 1
+
+            return account
+
+    def _release(self, account):
+        with self._lock:
+            account.in_flight -= 1
+
+    def _record_success(self, account):
+        with self._lock:
+            account.login_failures = 0
+
+    def _record_login_failure(self, account):
+        with self._lock:
+            account.login_failures += 1
+
+            if account.login_failures >= self._max_login_failures:
+                logger.warn('Ejecting account #%d for %d seconds after %d failed logins',
+                            account.index, self._ejection_period, account.login_failures)
+
+                account.login_failures = 0
+                account.ejected_until = time.time() + self._ejection_period
@@ -0,0 +1,117 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stacks of the threads handling the next few requests
+    and reports them in the folded format of flame graph tools:
+    one line per unique stack with the frames separated by semicolons
+    followed by the number of samples.
+    Only the operating system threads are sampled, not greenlets.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._pending = 0
+        self._threads = set()
+        self._stacks = defaultdict(int)
+        self._finished = threading.Event()
+        self._sampler = None
+
+    def start(self, requests):
+        """
+        Profiles the next `requests` requests, returns `False` if profiling is already in progress.
+        """
+
+        with self._lock:
+            if self._sampler is not None:
+                return False
+
+            self._remaining = self._pending = requests
+            self._threads = set()
+            self._stacks = defaultdict(int)
+            self._finished.clear()
+
+            self._sampler = threading.Thread(target=self._sample, name='sampling-profiler')
+            self._sampler.daemon = True
+            self._sampler.start()
+
+        logger.info('Profiling the next %d requests', requests)
+
+        return True
+
+    def request_started(self):
+        with self._lock:
+            if self._remaining > 0:
+                self._remaining -= 1
+                self._threads.add(threading.current_thread().ident)
+
+    def request_finished(self):
+        with self._lock:
+            ident = threading.current_thread().ident
+
+            if ident in self._threads:
+                self._threads.discard(ident)
+                self._pending -= 1
+
+                if self._pending <= 0:
+                    self._finished.set()
+
+    def wait(self, timeout):
+        """
+        Waits for the profiled requests to finish (or the `timeout`),
+        stops profiling and returns the folded stacks.
+        """
+
+        self._finished.wait(timeout)
+
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+            self._remaining = self._pending = 0
+            self._threads = set()
+
+        if sampler is not None:
+            sampler.join()
+
+        return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(self._stacks.items()))
+
+    def _sample(self):
+        current = threading.current_thread()
+
+        while self._sampler is current:
+            with self._lock:
+                threads = list(self._threads)
+
+            if threads:
+                frames = sys._current_frames()
+
+                for ident in threads:
+                    frame = frames.get(ident)
+
+                    if frame is not None:
+                        self._stacks[self._folded(frame)] += 1
+
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _folded(frame):
+        names = list()
+
+        while frame is not None:
+            code = frame.f_code
+            names.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+
+        return ';'.join(reversed(names))
@@ -0,0 +1,55 @@
+import time
+from threading import Lock
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` operations per second on average with bursts of up to `capacity` operations.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = time.time()
+
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill()
+
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+
+            return False
+
+    def wait_time(self, tokens=1):
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens=1, timeout=None):
+        started_at = time.time()
+
+        while not self.try_acquire(tokens):
+            wait = self.wait_time(tokens)
+
+            if timeout is not None and time.time() + wait > started_at + timeout:
+                return False
+
+            time.sleep(wait)
+
+        return True
@@ -0,0 +1,89 @@
+import gzip
+import json
+import logging
+from collections import namedtuple
+from hashlib import md5
+from StringIO import StringIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+# in order of preference
+ENCODINGS = ('br', 'gzip')
+DEFAULT_ENCODINGS = ENCODINGS if brotli is not None else ('gzip',)
+
+
+class EncodedResponse(namedtuple('EncodedResponse', ('body', 'etag', 'variants'))):
+    """
+    A serialized JSON response body with its ETag and its
+    compressed variants keyed by their content encoding.
+    """
+
+    __slots__ = ()
+
+    def encoded(self, encoding):
+        if encoding in self.variants:
+            return self.variants[encoding], '%s-%s' % (self.etag, encoding)
+
+        return self.body, self.etag
+
+
+def supported_encodings(encodings):
+    supported = list()
+
+    for encoding in encodings:
+        if encoding == 'br' and brotli is None:
+            logger.warn('The brotli module is not available, responses will not be compressed with it')
+            continue
+
+        if encoding not in ENCODINGS:
+            raise ValueError('Invalid response encoding: %s (supported: %s)' % (encoding, ', '.join(ENCODINGS)))
+
+        supported.append(encoding)
+
+    return tuple(encoding for encoding in ENCODINGS if encoding in supported)
+
+
+def serialize(payload):
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'))
+
+
+def join_object(items):
+    """
+    Returns a serialized JSON object of the (key, serialized JSON value) `items`,
+    without parsing and serializing the values again.
+    """
+
+    return '{%s}' % ','.join('%s:%s' % (serialize(key), value) for key, value in items)
+
+
+def encode(body, encodings=ENCODINGS):
+    variants = dict()
+
+    for encoding in encodings:
+        compressed = _compress(body, encoding)
+
+        # small bodies can get larger when compressed
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+
+    return EncodedResponse(body, md5(body).hexdigest(), variants)
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+
+    output = StringIO()
+
+    # a fixed modification time keeps the output the same for the same body
+    with gzip.GzipFile(fileobj=output, mode='wb', mtime=0) as compressed:
+        compressed.write(body)
+
+    return output.getvalue()
@@ -0,0 +1,145 @@
+import logging
+import random
+import time
+from collections import deque
+from threading import Lock
+
+from docker_helper import read_configuration
+from prometheus_client import Counter
+
+from governor import UpstreamUnavailable
+import deadlines
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+RETRIES = Counter(
+    'googleplay_retries_total', 'Upstream calls retried after a failure', ['operation']
+)
+RETRIES_DENIED = Counter(
+    'googleplay_retries_denied_total', 'Retries skipped because too many upstream calls are failing', ['operation']
+)
+
+# failing fast is the point of these, retrying them would only add load and latency
+_NEVER_RETRIED = (UpstreamUnavailable, deadlines.DeadlineExceeded)
+
+
+def create_retry_budget():
+    return RetryBudget(
+        max_failure_ratio=float(read_configuration(
+            'RETRY_BUDGET_FAILURE_RATIO', '/var/secrets/secrets.env', default='0.5'
+        )),
+        window=int(read_configuration('RETRY_BUDGET_WINDOW', '/var/secrets/secrets.env', default='10')),
+        min_calls=int(read_configuration('RETRY_BUDGET_MIN_CALLS', '/var/secrets/secrets.env', default='10'))
+    )
+
+
+class RetryBudget(object):
+    """
+    Tracks the outcome of the upstream calls over the last `window` seconds
+    and allows retries only while at most `max_failure_ratio` of them failed
+    (or fewer than `min_calls` were made), so retries do not multiply the load
+    while the upstream service is struggling.
+    """
+
+    def __init__(self, max_failure_ratio=0.5, window=10, min_calls=10):
+        self.max_failure_ratio = max_failure_ratio
+        self.window = window
+        self.min_calls = min_calls
+
+        self._lock = Lock()
+        self._buckets = deque()
+
+    def record(self, failed):
+        second = int(time.time())
+
+        with self._lock:
+            self._expire(second)
+
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+
+            self._buckets[-1][1] += 1
+
+            if failed:
+                self._buckets[-1][2] += 1
+
+    def allows_retry(self):
+        with self._lock:
+            self._expire(int(time.time()))
+
+            calls = sum(bucket[1] for bucket in self._buckets)
+            failures = sum(bucket[2] for bucket in self._buckets)
+
+        return calls < self.min_calls or failures <= calls * self.max_failure_ratio
+
+    def _expire(self, second):
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+
+
+class RetryPolicy(object):
+    """
+    Calls a function up to `max_attempts` times while it fails with errors `retryable` returns `True` for,
+    sleeping a random time between zero and the exponentially growing backoff
+    (`base_delay` doubled after each attempt, up to `max_delay`) before the retries.
+    The retries also stop when the shared retry `budget` is exhausted or the request deadline has passed.
+    """
+
+    def __init__(self, operation, max_attempts=3, base_delay=0.2, max_delay=5.0, retryable=None, budget=None):
+        self.operation = operation
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._retryable = retryable or (lambda error: True)
+        self._budget = budget
+        self._random = random.Random()
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            deadlines.check()
+
+            try:
+                result = func(*args, **kwargs)
+
+            except Exception as ex:
+                if isinstance(ex, _NEVER_RETRIED) or not self._retryable(ex):
+                    raise
+
+                self._record(failed=True)
+
+                if attempt >= self.max_attempts:
+                    raise
+
+                if self._budget is not None and not self._budget.allows_retry():
+                    RETRIES_DENIED.labels(self.operation).inc()
+
+                    logger.warn('Not retrying %s, too many upstream calls are failing: %s', self.operation, ex)
+                    raise
+
+                delay = self.backoff(attempt)
+
+                logger.info('Retrying %s in %.2f seconds after attempt #%d failed: %s',
+                            self.operation, delay, attempt, ex)
+
+                RETRIES.labels(self.operation).inc()
+
+                time.sleep(deadlines.timeout(delay))
+                continue
+
+            self._record(failed=False)
+
+            return result
+
+    def backoff(self, attempt):
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _record(self, failed):
+        if self._budget is not None:
+            self._budget.record(failed)
@@ -1,22 +1,88 @@
 import logging
+import marshal
 import os
 import re
+import socket
 import tempfile
-import time
-from hashlib import md5
+from httplib import HTTPException
 
-from bs4 import BeautifulSoup as soup
+from bs4 import BeautifulSoup as soup, SoupStrainer
+from prometheus_client import Counter, Histogram
 from urllib import quote_plus
-from urllib2 import urlopen
+
+from batch import fetch_many
+from coalescing import coalesced, SingleFlight
+from disk_cache import DiskCache
+from governor import UpstreamGovernor
+from http_client import HttpClient, HttpError
+from retry import RetryPolicy
+import timing
 
 logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
 logger = logging.getLogger('googleplay-proxy')
 logger.setLevel(logging.INFO)
 
+CACHE_REQUESTS = Counter(
+    'googleplay_scraper_cache_requests_total', 'Lookups in the page and results caches', ['cache', 'result']
+)
+FETCH_DURATION = Histogram(
+    'googleplay_scraper_fetch_duration_seconds', 'Latency of fetching the pages', ['page_type']
+)
+FETCHED_BYTES = Counter(
+    'googleplay_scraper_fetched_bytes_total', 'Size of the fetched pages', ['page_type']
+)
+PARSE_DURATION = Histogram(
+    'googleplay_scraper_parse_duration_seconds', 'Time spent parsing the pages', ['page_type']
+)
+
+PARSERS = ('html.parser', 'lxml', 'html5lib')
+
+
+def _classes(attrs):
+    classes = attrs.get('class') or ''
+
+    if isinstance(classes, basestring):
+        return classes.split()
+
+    return classes
+
+
+def _is_listing_card(name, attrs):
+    attrs = dict(attrs)
+    return name == 'div' and 'data-docid' in attrs and 'card' in _classes(attrs)
+
+
+def _is_details_content(name, attrs):
+    attrs = dict(attrs)
+
+    if name == 'link':
+        rel = attrs.get('rel') or ''
+        return 'canonical' in (rel.split() if isinstance(rel, basestring) else rel)
+
+    return name == 'div' and 'main-content' in _classes(attrs)
+
+
+LISTING_STRAINER = SoupStrainer(_is_listing_card)
+DETAILS_STRAINER = SoupStrainer(_is_details_content)
+
 
-def _read(path):
-    with open(path, 'r') as input_file:
-        return input_file.read()
+def _is_upstream_failure(error):
+    # client errors (like missing pages) are answered by a healthy upstream, apart from throttling
+    if isinstance(error, HttpError):
+        return error.status == 429 or error.status >= 500
+
+    return True
+
+
+def _is_transient(error):
+    if isinstance(error, HttpError):
+        return error.status == 429 or error.status >= 500
+
+    return isinstance(error, (socket.error, HTTPException))
+
+
+# marks results not found in the cache, as `None` is a valid result
+_MISSING = object()
 
 
 class Scraper(object):
@@ -26,36 +92,139 @@ class Scraper(object):
     PATH_DEVELOPER = '/store/apps/developer?id={developer_name}'
     PATH_DETAILS = '/store/apps/details?id={package_name}'
 
-    def __init__(self, cache_max_age=24 * 60 * 60):
+    # increment when the extracted items change to invalidate the cached results
+    PARSER_VERSION = 1
+
+    # the search and developer results are yielded as they are parsed
+    streams_incrementally = True
+
+    def __init__(self, cache_max_age=24 * 60 * 60, max_workers=8, http_client=None,
+                 disk_cache=None, results_cache=None, parser='html.parser', partial_parsing=False, governor=None,
+                 max_fetch_retries=2, retry_budget=None):
+
+        if parser not in PARSERS:
+            raise ValueError('Invalid parser "%s" (valid ones are: %s)' %
+                             (parser, ', '.join('"%s"' % valid for valid in PARSERS)))
+
         self.cache_max_age = cache_max_age
+        self.max_workers = max_workers
 
-    def _fetch(self, url):
-        url = self._url(url)
+        self.parser = parser
+        self.partial_parsing = partial_parsing
+
+        self._http_client = http_client or HttpClient(pool_size=max_workers)
+        self._disk_cache = disk_cache or DiskCache(
+            os.path.join(tempfile.gettempdir(), 'googleplay-proxy-scraper'), max_age=cache_max_age
+        )
+        self._results_cache = results_cache or DiskCache(
+            os.path.join(tempfile.gettempdir(), 'googleplay-proxy-scraper', 'results'),
+            max_age=cache_max_age, compress=True
+        )
+
+        self._governor = governor or UpstreamGovernor()
+
+        self._fetch_retry = RetryPolicy(
+            'fetch', max_attempts=max_fetch_retries + 1, base_delay=0.5, max_delay=5.0,
+            retryable=_is_transient, budget=retry_budget
+        )
+
+        self._single_flight = SingleFlight()
 
-        hashed = md5()
-        hashed.update(url)
-        filename = hashed.hexdigest()
+    @coalesced
+    def _fetch(self, url, page_type):
+        url = self._url(url)
 
-        path = os.path.join(tempfile.gettempdir(), '%s.content' % filename)
+        data = self._disk_cache.get(url)
 
-        if os.path.exists(path):
-            last_modified = os.path.getmtime(path)
+        if data is not None:
+            CACHE_REQUESTS.labels('pages', 'hit').inc()
 
-            if time.time() < last_modified + self.cache_max_age:
-                logger.info('URL found in cache: %s', url)
+            logger.info('URL found in cache: %s', url)
+            return data
 
-                with open(path) as cache_file:
-                    return cache_file.read()
+        CACHE_REQUESTS.labels('pages', 'miss').inc()
 
         logger.info('Fetching from URL: %s ...', url)
 
-        data = urlopen(url).read()
+        with FETCH_DURATION.labels(page_type).time(), timing.measure('upstream'):
+            data = self._fetch_retry.call(self._get, url)
+
+        FETCHED_BYTES.labels(page_type).inc(len(data))
 
-        with open(path, 'w') as cache_file:
-            cache_file.write(data)
+        self._disk_cache.set(url, data)
 
         return data
 
+    def _get(self, url):
+        with self._governor.permit(_is_upstream_failure):
+            return self._http_client.get(url)
+
+    def _cached_result(self, name, argument, parse):
+        key = self._result_key(name, argument)
+
+        result = self._load_result(key)
+
+        if result is _MISSING:
+            result = parse(argument)
+            self._store_result(key, result)
+
+        return result
+
+    def _iter_cached_result(self, name, argument, scrape):
+        """
+        Yields the cached items of the result, or the items scraped
+        as they are extracted, caching the result once all of them are.
+        """
+
+        key = self._result_key(name, argument)
+
+        cached = self._load_result(key)
+
+        if cached is not _MISSING:
+            for item in cached:
+                yield item
+
+            return
+
+        items = list()
+
+        for item in scrape(argument):
+            items.append(item)
+            yield item
+
+        self._store_result(key, items)
+
+    def _result_key(self, name, argument):
+        return '%s:%d:%s' % (name, self.PARSER_VERSION, argument)
+
+    def _load_result(self, key):
+        data = self._results_cache.get(key)
+
+        CACHE_REQUESTS.labels('results', 'hit' if data is not None else 'miss').inc()
+
+        if data is not None:
+            try:
+                return marshal.loads(data)
+
+            except (ValueError, EOFError, TypeError) as ex:
+                logger.warn('Failed to load cached result for %s: %s', key, ex)
+
+        return _MISSING
+
+    def _store_result(self, key, result):
+        try:
+            self._results_cache.set(key, marshal.dumps(result))
+
+        except ValueError as ex:
+            logger.warn('Failed to cache result for %s: %s', key, ex)
+
+    def _parse(self, markup, strainer, page_type):
+        with PARSE_DURATION.labels(page_type).time(), timing.measure('parse'):
+            if self.partial_parsing:
+                return soup(markup, self.parser, parse_only=strainer)
+
+            return soup(markup, self.parser)
+
     def _url(self, string):
         if '://' in string:
             return string
@@ -68,13 +237,19 @@ class Scraper(object):
 
         return string
 
+    @coalesced
     def search(self, package_prefix):
-        return list(self.scrape_search(package_prefix))
+        return self._cached_result('search', package_prefix,
+                                   lambda argument: list(self.scrape_search(argument)))
+
+    def iter_search(self, package_prefix):
+        return self._iter_cached_result('search', package_prefix, self.scrape_search)
 
     def scrape_search(self, package_prefix):
         logger.info('Searching with package prefix: %s', package_prefix)
 
-        html = soup(self._fetch(self.PATH_SEARCH.format(package_prefix=package_prefix)), 'html.parser')
+        html = self._parse(self._fetch(self.PATH_SEARCH.format(package_prefix=package_prefix), 'search'),
+                           LISTING_STRAINER, 'search')
 
         for elem in html.find_all('div', class_='card', attrs={'data-docid': True}):
             package_name = elem.attrs.get('data-docid', '')
@@ -84,13 +259,20 @@ class Scraper(object):
 
             yield self._fetch_from_search_result(elem)
 
+    @coalesced
     def developer(self, developer_name):
-        return list(self.scrape_developer(developer_name))
+        return self._cached_result('developer', developer_name,
+                                   lambda argument: list(self.scrape_developer(argument)))
+
+    def iter_developer(self, developer_name):
+        return self._iter_cached_result('developer', developer_name, self.scrape_developer)
 
     def scrape_developer(self, developer_name):
         logger.info('Searching for developer: %s', developer_name)
 
-        html = soup(self._fetch(self.PATH_DEVELOPER.format(developer_name=quote_plus(developer_name))), 'html.parser')
+        html = self._parse(self._fetch(self.PATH_DEVELOPER.format(developer_name=quote_plus(developer_name)),
+                                       'developer'),
+                           LISTING_STRAINER, 'developer')
 
         for elem in html.find_all('div', class_='card', attrs={'data-docid': True}):
             yield self._fetch_from_search_result(elem)
@@ -121,13 +303,20 @@ class Scraper(object):
 
         return item
 
+    @coalesced
     def get_details(self, package_name):
-        return self.scrape_details(package_name)
+        return self._cached_result('details', package_name, self.scrape_details)
+
+    def get_details_many(self, package_names, failures=None):
+        logger.info('Fetching details for %d packages', len(package_names))
+
+        return fetch_many(self.get_details, package_names, self.max_workers, failures)
 
     def scrape_details(self, package_name):
         logger.info('Fetching details for: %s', package_name)
 
-        html = soup(self._fetch(self.PATH_DETAILS.format(package_name=package_name)), 'html.parser')
+        html = self._parse(self._fetch(self.PATH_DETAILS.format(package_name=package_name), 'details'),
+                           DETAILS_STRAINER, 'details')
 
         elem = html.find('div', class_='main-content')
 
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+def start():
+    """
+    Starts collecting the timings of the current request on this thread.
+    """
+
+    _local.timings = OrderedDict()
+    _local.active = list()
+
+
+def stop():
+    """
+    Stops collecting and returns the timings of the current request in milliseconds,
+    or `None` if they were not collected.
+    """
+
+    timings = getattr(_local, 'timings', None)
+
+    _local.timings = None
+    _local.active = None
+
+    return timings
+
+
+@contextmanager
+def measure(name):
+    """
+    Adds the time spent in the block to the `name` timing of the current request.
+    Nested blocks with the same name are only counted once,
+    work done on other threads is not counted.
+    """
+
+    timings = getattr(_local, 'timings', None)
+
+    if timings is None or name in _local.active:
+        yield
+        return
+
+    _local.active.append(name)
+    started_at = time.time()
+
+    try:
+        yield
+
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.time() - started_at) * 1000.0
+        _local.active.remove(name)
+
+
+def server_timing(timings):
+    return ', '.join('%s;dur=%.1f' % (name, duration) for name, duration in timings.items())
@@ -0,0 +1,115 @@
+import errno
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import deadlines
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s] %(module)s.%(funcName)s - %(message)s')
+logger = logging.getLogger('googleplay-proxy')
+logger.setLevel(logging.INFO)
+
+
+class TokenStore(object):
+    """
+    Persists the authentication token in a file, so that it can be reused
+    after restarts and shared between processes using the same path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as token_file:
+                stored = json.load(token_file)
+
+            return stored.get('token'), stored.get('created_at', 0)
+
+        except (IOError, OSError, ValueError):
+            return None, 0
+
+    def _directory(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        return directory
+
+    def save(self, token, created_at=None):
+        try:
+            handle, temporary_path = tempfile.mkstemp(dir=self._directory(), prefix='.token-')
+
+        except (IOError, OSError) as ex:
+            logger.warn('Failed to save the authentication token to %s: %s', self.path, ex)
+            return
+
+        try:
+            with os.fdopen(handle, 'w') as token_file:
+                json.dump({'token': token, 'created_at': created_at or time.time()}, token_file)
+
+            os.chmod(temporary_path, 0600)
+            os.rename(temporary_path, self.path)
+
+        except (IOError, OSError) as ex:
+            logger.warn('Failed to save the authentication token to %s: %s', self.path, ex)
+
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def invalidate(self, token):
+        stored, _ = self.load()
+
+        if stored is not None and stored == token:
+            try:
+                os.remove(self.path)
+
+            except OSError:
+                pass
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds an exclusive lock shared by all processes using the same path,
+        waiting for it at most until the request deadline.
+        Runs the block without the lock if the lock file can not be opened.
+        """
+
+        try:
+            self._directory()
+            lock_file = open('%s.lock' % self.path, 'a')
+
+        except (IOError, OSError) as ex:
+            logger.warn('Failed to open the lock file for %s, continuing without it: %s', self.path, ex)
+
+            yield
+            return
+
+        with lock_file:
+            deadlines.acquire(
+                lambda: self._try_lock(lock_file), 'Request deadline exceeded while waiting for the token store lock'
+            )
+
+            try:
+                yield
+
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _try_lock(lock_file):
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+
+        except IOError as ex:
+            if ex.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+
+            return False
+
@@ -0,0 +1,186 @@
+import fnmatch
+import socket
+import threading
+import time
+
+from SocketServer import ThreadingTCPServer, StreamRequestHandler
+
+
+class FakeRedisServer(ThreadingTCPServer):
+    """
+    A minimal in-memory stand-in speaking enough of the Redis protocol
+    for the `werkzeug` `RedisCache` backend.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), _RedisRequestHandler)
+
+        self.data = dict()
+        self.expiry = dict()
+        self.commands = list()
+        self.lock = threading.Lock()
+
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'redis://%s:%d/0' % self.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def execute(self, command, *args):
+        with self.lock:
+            self.commands.append(command)
+            self._expire_keys()
+
+            handler = getattr(self, '_cmd_%s' % command.lower(), None)
+
+            if handler is None:
+                return RedisError('ERR unknown command \'%s\'' % command)
+
+            return handler(*args)
+
+    def _expire_keys(self):
+        now = time.time()
+
+        for key, expires_at in list(self.expiry.items()):
+            if expires_at <= now:
+                self.data.pop(key, None)
+                self.expiry.pop(key, None)
+
+    def _cmd_ping(self, *args):
+        return 'PONG'
+
+    def _cmd_select(self, db):
+        return 'OK'
+
+    def _cmd_get(self, key):
+        return self.data.get(key)
+
+    def _cmd_mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def _cmd_set(self, key, value, *options):
+        self.data[key] = value
+        self.expiry.pop(key, None)
+        return 'OK'
+
+    def _cmd_setex(self, key, seconds, value):
+        self.data[key] = value
+        self.expiry[key] = time.time() + int(seconds)
+        return 'OK'
+
+    def _cmd_setnx(self, key, value):
+        if key in self.data:
+            return 0
+
+        self.data[key] = value
+        return 1
+
+    def _cmd_expire(self, key, seconds):
+        if key not in self.data:
+            return 0
+
+        self.expiry[key] = time.time() + int(seconds)
+        return 1
+
+    def _cmd_del(self, *keys):
+        removed = 0
+
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                removed += 1
+
+            self.expiry.pop(key, None)
+
+        return removed
+
+    def _cmd_exists(self, *keys):
+        return sum(1 for key in keys if key in self.data)
+
+    def _cmd_incrby(self, key, amount):
+        value = int(self.data.get(key) or 0) + int(amount)
+        self.data[key] = str(value)
+        return value
+
+    def _cmd_decrby(self, key, amount):
+        return self._cmd_incrby(key, -int(amount))
+
+    def _cmd_keys(self, pattern):
+        return [key for key in self.data if fnmatch.fnmatchcase(key, pattern)]
+
+    def _cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expiry.clear()
+        return 'OK'
+
+
+class RedisError(object):
+    def __init__(self, message):
+        self.message = message
+
+
+class _RedisRequestHandler(StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+
+            except socket.error:
+                return
+
+            if not command:
+                return
+
+            self._write(self.server.execute(*command))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+
+        if not line:
+            return None
+
+        if not line.startswith('*'):
+            return line.strip().split()
+
+        arguments = list()
+
+        for _ in xrange(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+
+        return arguments
+
+    def _write(self, value):
+        self.wfile.write(self._encode(value))
+        self.wfile.flush()
+
+    def _encode(self, value):
+        if value is None:
+            return '$-1\r\n'
+
+        if isinstance(value, RedisError):
+            return '-%s\r\n' % value.message
+
+        if isinstance(value, bool) or isinstance(value, int):
+            return ':%d\r\n' % value
+
+        if isinstance(value, list):
+            return '*%d\r\n%s' % (len(value), ''.join(self._encode(item) for item in value))
+
+        if value in ('OK', 'PONG'):
+            return '+%s\r\n' % value
+
+        return '$%d\r\n%s\r\n' % (len(value), value)
@@ -1,7 +1,14 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from prometheus_client import REGISTRY
 from unittest_helper import get_api_client
 
 from api import ApiLoginException
+import deadlines
 
 
 class ApiClientTest(unittest.TestCase):
@@ -14,7 +21,7 @@ class ApiClientTest(unittest.TestCase):
         self.assertTrue(self.api.is_logged_in(), msg='Failed to log in')
 
     def test_login_failure(self):
-        api = get_api_client(unauthorized=True)
+        api = get_api_client(unauthorized=True, login_retry_max_delay=0.2)
 
         try:
             api.login()
@@ -26,6 +33,25 @@ class ApiClientTest(unittest.TestCase):
 
         self.assertFalse(api.is_logged_in(), msg='Expected not to be logged in')
 
+    def test_login_retries_stop_at_the_deadline(self):
+        api = get_api_client(unauthorized=True)
+
+        deadlines.start(0.3)
+
+        try:
+            started_at = time.time()
+
+            self.assertRaises(deadlines.DeadlineExceeded, api.login)
+            self.assertLess(time.time() - started_at, 1)
+
+            self.assertRaises(deadlines.DeadlineExceeded, api.get_details, 'hu.rycus.deadline')
+
+        finally:
+            deadlines.clear()
+
+    def test_iter_search(self):
+        self.assertEqual(list(self.api.iter_search('hu.rycus')), self.api.search('hu.rycus'))
+
     def test_search(self):
         results = self.api.search('hu.rycus')
 
@@ -108,3 +134,183 @@ class ApiClientTest(unittest.TestCase):
             self.assertLessEqual(star, 5)
 
             self.assertGreaterEqual(count, 0)
+
+    def test_details_many(self):
+        results = self.api.get_details_many(['hu.rycus.tweetwear', 'hu.rycus.watchface', 'hu.rycus.tweetwear'])
+
+        self.assertEqual(set(results.keys()), {'hu.rycus.tweetwear', 'hu.rycus.watchface'})
+
+        for package_name, item in results.items():
+            self.assertEqual(item.get('package_name'), package_name)
+            self.assertIn('description_html', item)
+
+    def test_details_bulk(self):
+        api = get_api_client(bulk_details=True, bulk_chunk_size=2)
+
+        package_names = ['hu.rycus.app%d' % idx for idx in range(5)] + ['missing.package']
+
+        results = api.get_details_many(package_names)
+
+        self.assertEqual(set(results.keys()), set(package_names))
+        self.assertIsNone(results['missing.package'])
+
+        for package_name in package_names[:-1]:
+            self.assertEqual(results[package_name].get('package_name'), package_name)
+            self.assertIn('description_html', results[package_name])
+
+        self.assertEqual(len(api._api.bulk_requests), 3)
+        self.assertEqual(sorted(len(request) for request in api._api.bulk_requests), [2, 2, 2])
+
+    def test_token_is_persisted_and_reused(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            path = os.path.join(directory, 'token.json')
+
+            first = get_api_client(token_cache_path=path)
+            first.login()
+
+            token = first._api.authSubToken
+
+            self.assertEqual(first._api.logins, [None])
+            self.assertTrue(os.path.exists(path))
+
+            second = get_api_client(token_cache_path=path)
+            second.login()
+
+            self.assertTrue(second.is_logged_in())
+            self.assertEqual(second._api.logins, [token])
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_invalid_stored_token_is_replaced(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            path = os.path.join(directory, 'token.json')
+
+            api = get_api_client(token_cache_path=path)
+            api.login()
+
+            api._api.revoked_tokens.add(api._api.authSubToken)
+
+            item = api.get_details('hu.rycus.tweetwear')
+
+            self.assertEqual(item.get('package_name'), 'hu.rycus.tweetwear')
+            self.assertEqual(api._api.logins, [None, None])
+
+            other = get_api_client(token_cache_path=path)
+            other.login()
+
+            self.assertEqual(other._api.logins, [api._api.authSubToken])
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_concurrent_relogin_is_deduplicated(self):
+        self.api.login()
+        self.api._api.revoked_tokens.add(self.api._api.authSubToken)
+
+        results = list()
+
+        def fetch(package_name):
+            results.append(self.api.get_details(package_name))
+
+        threads = [threading.Thread(target=fetch, args=('hu.rycus.app%d' % idx,)) for idx in range(10)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(self.api._api.logins, [None, None])
+        self.assertEqual(self.api.token_generation(), 2)
+
+    def test_metrics(self):
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        logins = sample('googleplay_api_login_attempts_total', result='success')
+        relogins = sample('googleplay_api_decode_error_relogins_total')
+        details_calls = sample('googleplay_api_upstream_duration_seconds_count', method='details')
+
+        self.api.login()
+        self.api._api.revoked_tokens.add(self.api._api.authSubToken)
+
+        self.api.get_details('hu.rycus.metrics')
+
+        self.assertEqual(sample('googleplay_api_login_attempts_total', result='success'), logins + 2)
+        self.assertEqual(sample('googleplay_api_decode_error_relogins_total'), relogins + 1)
+        self.assertEqual(sample('googleplay_api_upstream_duration_seconds_count', method='details'),
+                         details_calls + 2)
+
+    def test_login_with_outdated_generation(self):
+        self.api.login()
+
+        generation = self.api.token_generation()
+
+        self.api.login(generation)
+        self.api.login(generation)
+
+        self.assertEqual(len(self.api._api.logins), 2)
+
+    def test_token_is_refreshed_in_the_background(self):
+        api = get_api_client(token_refresh_interval=60)
+        api.login()
+
+        original_token = api._api.authSubToken
+        api._token_created_at -= 120
+
+        self.assertGreater(len(api.search('hu.rycus')), 0)
+        self.assertTrue(api.is_logged_in())
+
+        for _ in range(100):
+            if api.token_generation() == 2 and not api._refreshing_token:
+                break
+
+            time.sleep(0.05)
+
+        self.assertEqual(api.token_generation(), 2)
+        self.assertNotEqual(api._api.authSubToken, original_token)
+
+        api.search('hu.rycus')
+
+        self.assertEqual(len(api._api.logins), 2)
+
+    def test_waiting_for_another_login_stops_at_the_deadline(self):
+        self.api._login_lock.acquire()
+
+        deadlines.start(0.1)
+
+        try:
+            started_at = time.time()
+
+            self.assertRaises(deadlines.DeadlineExceeded, self.api.login)
+            self.assertLess(time.time() - started_at, 1)
+
+        finally:
+            deadlines.clear()
+            self.api._login_lock.release()
+
+        self.api.login()
+
+        self.assertTrue(self.api.is_logged_in())
+
+    def test_token_cache_in_missing_directory(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            path = os.path.join(directory, 'missing', 'token.json')
+
+            api = get_api_client(token_cache_path=path)
+            api.login()
+
+            self.assertTrue(api.is_logged_in())
+            self.assertTrue(os.path.exists(path))
+
+        finally:
+            shutil.rmtree(directory)
+
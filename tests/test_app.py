@@ -1,11 +1,18 @@
+import gzip
 import os
 import json
+import shutil
+import tempfile
+import threading
+import time
+from StringIO import StringIO
 
 import unittest
 
 from unittest_helper import get_api_client
 
 import app
+from api import ApiLoginException
 
 
 class AppTest(unittest.TestCase):
@@ -40,6 +47,122 @@ class AppTest(unittest.TestCase):
 
             self._verify_item(item, simple=True)
 
+    def test_stream_search_results(self):
+        expected = json.loads(self.client.get('/search/hu.rycus.stream').data)
+
+        for response in (self.client.get('/search/hu.rycus.stream?stream=1'),
+                         self.client.get('/search/hu.rycus.stream', headers={'Accept': 'application/x-ndjson'}),
+                         self.client.get('/search/hu.rycus.uncached', headers={'Accept': 'application/x-ndjson'})):
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+
+            lines = response.data.splitlines()
+
+            self.assertEqual(len(lines), len(expected))
+
+            for line, item in zip(lines, expected):
+                self.assertEqual(json.loads(line).get('title'), item.get('title'))
+
+    def test_streamed_results_are_cached(self):
+        original_iter_search = app.api.iter_search
+        searched = list()
+
+        def iter_search(package_prefix):
+            searched.append(package_prefix)
+            return original_iter_search(package_prefix)
+
+        app.api.iter_search = iter_search
+
+        try:
+            for incremental in (False, True):
+                app.api.streams_incrementally = incremental
+                package_prefix = 'hu.rycus.streamed.%s' % incremental
+
+                streamed = [self.client.get('/search/%s?stream=1' % package_prefix).data for _ in range(3)]
+
+                self.assertEqual(searched.count(package_prefix), 1)
+                self.assertEqual(streamed[0], streamed[1])
+                self.assertEqual(streamed[0], streamed[2])
+
+                self.assertEqual(len(json.loads(self.client.get('/search/%s' % package_prefix).data)),
+                                 len(streamed[0].splitlines()))
+
+        finally:
+            app.api.iter_search = original_iter_search
+            del app.api.streams_incrementally
+
+    def test_server_timing(self):
+        app.server_timing_rate = 1.0
+
+        try:
+            response = self.client.get('/details/hu.rycus.timing')
+
+        finally:
+            app.server_timing_rate = 0
+
+        timings = dict(timing.split(';dur=') for timing in response.headers.get('Server-Timing').split(', '))
+
+        self.assertIn('cache', timings)
+        self.assertIn('upstream', timings)
+        self.assertIn('parse', timings)
+        self.assertIn('serialize', timings)
+        self.assertIn('total', timings)
+
+        self.assertIsNone(self.client.get('/details/hu.rycus.timing').headers.get('Server-Timing'))
+
+    def test_server_timing_after_failed_request(self):
+        def get_details(package_name):
+            raise ApiLoginException('Login failed')
+
+        app.api.get_details = get_details
+        app.server_timing_rate = 1.0
+
+        try:
+            self.assertRaises(ApiLoginException, self.client.get, '/details/hu.rycus.failed-timing')
+
+        finally:
+            app.server_timing_rate = 0
+            del app.api.get_details
+
+        response = self.client.get('/details/hu.rycus.after-failed-timing')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.headers.get('Server-Timing'))
+
+    def test_profiling(self):
+        self.assertEqual(self.client.get('/debug/profile').status_code, 404)
+
+        app.debug_token = 'secret'
+
+        try:
+            self.assertEqual(self.client.get('/debug/profile', headers={'X-Debug-Token': 'invalid'}).status_code, 404)
+
+            responses = list()
+
+            def profile():
+                responses.append(app.app.test_client().get('/debug/profile?requests=1&timeout=5',
+                                                           headers={'X-Debug-Token': 'secret'}))
+
+            thread = threading.Thread(target=profile)
+            thread.start()
+
+            while app.profiler._sampler is None:
+                time.sleep(0.01)
+
+            self.assertEqual(self.client.get('/debug/profile?requests=1',
+                                             headers={'X-Debug-Token': 'secret'}).status_code, 409)
+
+            self.client.get('/search/hu.rycus.profiled')
+
+            thread.join()
+
+        finally:
+            app.debug_token = None
+
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(responses[0].mimetype, 'text/plain')
+
     def test_get_application_details(self):
         response = self.client.get('/details/hu.rycus.tweetwear')
 
@@ -62,6 +185,271 @@ class AppTest(unittest.TestCase):
         self.assertIn('version_string', details)
         self.assertIn('recent_changes_html', details)
 
+    def test_conditional_requests(self):
+        response = self.client.get('/details/hu.rycus.conditional')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.headers.get('ETag'))
+        self.assertFalse(response.headers.get('ETag').startswith('W/'))
+        self.assertEqual(response.cache_control.max_age, app.response_cache.soft_timeout)
+
+        not_modified = self.client.get('/details/hu.rycus.conditional',
+                                       headers={'If-None-Match': response.headers.get('ETag')})
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b'')
+        self.assertEqual(not_modified.headers.get('ETag'), response.headers.get('ETag'))
+
+        modified = self.client.get('/details/hu.rycus.conditional', headers={'If-None-Match': '"outdated"'})
+
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(json.loads(modified.data).get('package_name'), 'hu.rycus.conditional')
+
+    def test_compressed_response(self):
+        plain = self.client.get('/details/hu.rycus.compressed')
+        compressed = self.client.get('/details/hu.rycus.compressed', headers={'Accept-Encoding': 'gzip, deflate'})
+
+        self.assertEqual(plain.headers.get('Vary'), 'Accept, Accept-Encoding')
+        self.assertIsNone(plain.headers.get('Content-Encoding'))
+
+        self.assertEqual(compressed.status_code, 200)
+        self.assertEqual(compressed.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(compressed.headers.get('Vary'), 'Accept, Accept-Encoding')
+        self.assertNotEqual(compressed.headers.get('ETag'), plain.headers.get('ETag'))
+
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed.data)).read(), plain.data)
+
+        not_modified = self.client.get('/details/hu.rycus.compressed',
+                                       headers={'Accept-Encoding': 'gzip',
+                                                'If-None-Match': compressed.headers.get('ETag')})
+
+        self.assertEqual(not_modified.status_code, 304)
+
+        many = self.client.get('/details?packages=hu.rycus.compressed,hu.rycus.other',
+                               headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(many.headers.get('Content-Encoding'), 'gzip')
+
+        details = json.loads(gzip.GzipFile(fileobj=StringIO(many.data)).read())
+
+        self.assertEqual(details['hu.rycus.compressed'], json.loads(plain.data))
+        self.assertEqual(details['hu.rycus.other'].get('package_name'), 'hu.rycus.other')
+
+    def test_get_application_details_many(self):
+        response = self.client.get('/details?packages=hu.rycus.tweetwear,hu.rycus.watchface')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/json')
+
+        details = json.loads(response.data)
+
+        self.assertEqual(set(details.keys()), {'hu.rycus.tweetwear', 'hu.rycus.watchface'})
+
+        for package_name, item in details.items():
+            self.assertEqual(item.get('package_name'), package_name)
+
+            self._verify_item(item, simple=False)
+
+    def test_get_application_details_many_with_post(self):
+        response = self.client.post('/details', data=json.dumps({'packages': ['hu.rycus.tweetwear']}),
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+
+        details = json.loads(response.data)
+
+        self.assertEqual(list(details.keys()), ['hu.rycus.tweetwear'])
+        self.assertEqual(details['hu.rycus.tweetwear'].get('package_name'), 'hu.rycus.tweetwear')
+
+    def test_get_application_details_many_uses_cache(self):
+        cached = self.client.get('/details/hu.rycus.cached')
+
+        self.assertEqual(cached.status_code, 200)
+
+        original_get_details_many = app.api.get_details_many
+        requested = list()
+
+        def get_details_many(package_names, failures=None):
+            requested.extend(package_names)
+            return original_get_details_many(package_names, failures)
+
+        app.api.get_details_many = get_details_many
+
+        try:
+            response = self.client.get('/details?packages=hu.rycus.cached,hu.rycus.missing')
+
+        finally:
+            app.api.get_details_many = original_get_details_many
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(requested, ['hu.rycus.missing'])
+        self.assertEqual(set(json.loads(response.data).keys()), {'hu.rycus.cached', 'hu.rycus.missing'})
+
+    def test_upstream_unavailable(self):
+        def get_details(package_name):
+            raise app.UpstreamUnavailable('circuit open', retry_after=9.5)
+
+        app.api.get_details = get_details
+
+        try:
+            response = self.client.get('/details/hu.rycus.unavailable')
+
+        finally:
+            del app.api.get_details
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers.get('Retry-After'), '10')
+        self.assertEqual(json.loads(response.data).get('reason'), 'circuit open')
+
+    def test_deadline_exceeded(self):
+        def get_details(package_name):
+            self.assertIsNotNone(app.deadlines.current())
+            raise app.DeadlineExceeded('Request deadline exceeded')
+
+        app.api.get_details = get_details
+
+        try:
+            response = self.client.get('/details/hu.rycus.deadline')
+
+        finally:
+            del app.api.get_details
+
+        self.assertEqual(response.status_code, 504)
+        self.assertIsNone(app.deadlines.current())
+
+    def test_unknown_packages_are_remembered(self):
+        requested = list()
+
+        def get_details(package_name):
+            requested.append(package_name)
+
+            if package_name == 'hu.rycus.failing':
+                raise app.HttpError('https://play.google.com', 503)
+
+            if package_name == 'hu.rycus.nothing':
+                # the scraper's result for unknown packages
+                return None
+
+            raise app.RequestError('Item not found.')
+
+        app.api.get_details = get_details
+
+        try:
+            for _ in range(2):
+                for package_name in ('hu.rycus.unknown', 'hu.rycus.nothing'):
+                    response = self.client.get('/details/%s' % package_name)
+
+                    self.assertEqual(response.status_code, 404)
+                    self.assertEqual(response.mimetype, 'application/json')
+                    self.assertEqual(json.loads(response.data), {'error': 'Not found'})
+
+                self.assertEqual(self.client.get('/details/hu.rycus.failing').status_code, 502)
+
+        finally:
+            del app.api.get_details
+
+        self.assertEqual(requested, ['hu.rycus.unknown', 'hu.rycus.nothing', 'hu.rycus.failing', 'hu.rycus.failing'])
+
+        original_get_details_many = app.api.get_details_many
+        requested = list()
+
+        def get_details_many(package_names, failures=None):
+            requested.extend(package_names)
+            return dict.fromkeys(package_names)
+
+        app.api.get_details_many = get_details_many
+
+        try:
+            for _ in range(2):
+                response = self.client.get('/details?packages=hu.rycus.unknown,hu.rycus.absent')
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.data), {'hu.rycus.unknown': None, 'hu.rycus.absent': None})
+
+        finally:
+            app.api.get_details_many = original_get_details_many
+
+        self.assertEqual(requested, ['hu.rycus.absent'])
+        self.assertEqual(self.client.get('/details/hu.rycus.absent').status_code, 404)
+
+    def test_failed_batch_lookups_are_remembered(self):
+        requested = list()
+
+        def get_details(package_name):
+            requested.append(package_name)
+
+            if package_name == 'no.such.failing':
+                raise app.HttpError('https://play.google.com', 503)
+
+            raise app.RequestError('Item not found.')
+
+        app.api.get_details = get_details
+
+        try:
+            for _ in range(3):
+                response = self.client.get('/details?packages=no.such.a,no.such.b,no.such.failing')
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.data),
+                                 {'no.such.a': None, 'no.such.b': None, 'no.such.failing': None})
+
+        finally:
+            del app.api.get_details
+
+        self.assertEqual(sorted(requested), ['no.such.a', 'no.such.b'] + ['no.such.failing'] * 3)
+
+    def test_get_application_details_many_without_packages(self):
+        self.assertEqual(self.client.get('/details').status_code, 400)
+        self.assertEqual(self.client.get('/details?packages=,').status_code, 400)
+        self.assertEqual(self.client.post('/details', data='invalid',
+                                          content_type='application/json').status_code, 400)
+
+    def test_account_pool_api(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            path = os.path.join(directory, 'accounts.json')
+
+            with open(path, 'w') as accounts:
+                json.dump([
+                    {'android_id': 'aid1', 'username': 'user1', 'password': 'pass1'},
+                    {'android_id': 'aid2', 'username': 'user2', 'password': 'pass2'}
+                ], accounts)
+
+            os.environ['GOOGLE_ACCOUNTS_FILE'] = path
+
+            try:
+                api = app.load_api()
+
+                self.assertIsInstance(api, app.ApiClientPool)
+                self.assertEqual(len(api._accounts), 2)
+
+            finally:
+                del os.environ['GOOGLE_ACCOUNTS_FILE']
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_api_is_loaded_again_after_fork(self):
+        original_api, original_pid = app.api, app._api_pid
+
+        try:
+            app._api_pid = os.getpid()
+
+            self.assertIs(app.get_api(), original_api)
+
+            # as if the client was created in the parent process before forking
+            app._api_pid = -1
+
+            reloaded = app.get_api()
+
+            self.assertIsNot(reloaded, original_api)
+            self.assertIsInstance(reloaded, app.ApiClient)
+            self.assertEqual(app._api_pid, os.getpid())
+
+        finally:
+            app.api, app._api_pid = original_api, original_pid
+
     def test_scraper_api(self):
         os.environ['API_TYPE'] = 'scraper'
 
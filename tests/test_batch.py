@@ -0,0 +1,82 @@
+import threading
+import unittest
+
+from unittest_helper import get_api_client
+
+import deadlines
+from api import ApiLoginException
+from batch import fetch_many, unique
+
+
+class BatchTest(unittest.TestCase):
+    def test_unique(self):
+        self.assertEqual(unique(['b', 'a', 'b', 'c', 'a']), ['b', 'a', 'c'])
+
+    def test_fetch_many(self):
+        results = fetch_many(lambda key: key.upper(), ['a', 'b', 'a', 'c'], max_workers=4)
+
+        self.assertEqual(results, {'a': 'A', 'b': 'B', 'c': 'C'})
+
+    def test_failed_keys_are_left_out(self):
+        def fetch(key):
+            if key == 'invalid':
+                raise ValueError('Failed to fetch %s' % key)
+
+            return key
+
+        self.assertEqual(fetch_many(fetch, ['valid', 'invalid'], max_workers=2), {'valid': 'valid'})
+
+        failures = dict()
+
+        self.assertEqual(fetch_many(fetch, ['valid', 'invalid'], max_workers=2, failures=failures), {'valid': 'valid'})
+        self.assertEqual(list(failures.keys()), ['invalid'])
+        self.assertIsInstance(failures['invalid'], ValueError)
+
+    def test_deadline_is_propagated(self):
+        deadlines.start(0.1)
+
+        try:
+            def fetch(key):
+                if key == 'late':
+                    threading.Event().wait(0.2)
+
+                deadlines.check()
+
+                return deadlines.current()
+
+            results = fetch_many(fetch, ['a', 'b'], max_workers=2)
+
+            self.assertEqual(results, {'a': deadlines.current(), 'b': deadlines.current()})
+
+            self.assertRaises(deadlines.DeadlineExceeded, fetch_many, fetch, ['a', 'late'], max_workers=2)
+
+        finally:
+            deadlines.clear()
+
+    def test_login_failure_is_raised(self):
+        client = get_api_client(unauthorized=True, max_login_retries=1)
+
+        self.assertRaises(ApiLoginException, client.get_details_many, ['a.b', 'c.d', 'e.f'])
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        running = [0]
+        max_running = [0]
+
+        def fetch(key):
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+
+            threading.Event().wait(0.01)
+
+            with lock:
+                running[0] -= 1
+
+            return key
+
+        results = fetch_many(fetch, [str(idx) for idx in range(20)], max_workers=3)
+
+        self.assertEqual(len(results), 20)
+        self.assertLessEqual(max_running[0], 3)
+        self.assertGreater(max_running[0], 1)
@@ -0,0 +1,291 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from flask_cache import Cache
+from prometheus_client import REGISTRY
+from werkzeug.contrib.cache import SimpleCache
+
+import caching
+from api import ApiLoginException
+from caching import cache_configuration, NegativeCache, ResponseCache
+from fake_redis import FakeRedisServer
+from governor import UpstreamUnavailable
+
+
+class CacheConfigurationTest(unittest.TestCase):
+    def setUp(self):
+        self.original_environ = dict(os.environ)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+
+    def test_defaults(self):
+        config = cache_configuration()
+
+        self.assertEqual(config['CACHE_TYPE'], 'simple')
+        self.assertEqual(config['CACHE_DEFAULT_TIMEOUT'], 3600)
+
+    def test_invalid_cache_type(self):
+        os.environ['CACHE_TYPE'] = 'unknown'
+
+        self.assertRaises(ValueError, cache_configuration)
+
+    def test_filesystem_cache(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            os.environ['CACHE_TYPE'] = 'filesystem'
+            os.environ['CACHE_DIR'] = directory
+
+            first = self._create_cache()
+            first.set('shared-key', {'package_name': 'mock.package'})
+
+            second = self._create_cache()
+
+            self.assertEqual(second.get('shared-key'), {'package_name': 'mock.package'})
+            self.assertGreater(len(os.listdir(directory)), 0)
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_redis_cache(self):
+        server = FakeRedisServer().start()
+
+        try:
+            os.environ['CACHE_TYPE'] = 'redis'
+            os.environ['CACHE_REDIS_URL'] = server.url
+            os.environ['CACHE_KEY_PREFIX'] = 'test:'
+
+            first = self._create_cache()
+            first.set('shared-key', [{'package_name': 'mock.package'}])
+
+            second = self._create_cache()
+
+            self.assertEqual(second.get('shared-key'), [{'package_name': 'mock.package'}])
+            self.assertIn('test:shared-key', server.data)
+
+            self.assertIn('SETEX', server.commands)
+            self.assertIn('GET', server.commands)
+
+        finally:
+            server.stop()
+
+    def test_memcached_servers(self):
+        os.environ['CACHE_TYPE'] = 'memcached'
+        os.environ['CACHE_MEMCACHED_SERVERS'] = 'cache-1:11211,cache-2:11211'
+
+        config = cache_configuration()
+
+        self.assertEqual(config['CACHE_MEMCACHED_SERVERS'], ['cache-1:11211', 'cache-2:11211'])
+
+    @staticmethod
+    def _create_cache():
+        return Cache(Flask(__name__), config=cache_configuration())
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.original_time = caching.time
+        caching.time = self
+
+        self.now = 1000.0
+        self.loaded = list()
+
+        self.cache = ResponseCache(SimpleCache(), soft_timeout=60, hard_timeout=600)
+
+        @self.cache.cached('details')
+        def load(package_name):
+            self.loaded.append(package_name)
+            return {'package_name': package_name, 'loaded_at': self.now}
+
+        self.load = load
+
+    def tearDown(self):
+        caching.time = self.original_time
+
+    def time(self):
+        return self.now
+
+    def test_cache_hit(self):
+        first = self.load('mock.package')
+        second = self.load('mock.package')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.loaded, ['mock.package'])
+
+    def test_metrics(self):
+        def requests(result):
+            return REGISTRY.get_sample_value('googleplay_response_cache_requests_total',
+                                             {'cache': 'metrics', 'result': result}) or 0
+
+        load = self.cache.cached('metrics')(lambda package_name: package_name)
+
+        load('mock.package')
+        load('mock.package')
+
+        self.now += 120
+
+        load('mock.package')
+        self.cache.join()
+
+        self.assertEqual((requests('hit'), requests('stale'), requests('miss')), (1, 1, 1))
+
+    def test_cache_key(self):
+        self.assertEqual(ResponseCache.cache_key('developer', u'Test Dev'), 'developer:Test+Dev')
+
+        self.load('mock.package')
+
+        self.assertEqual(self.cache.get('details:mock.package')['package_name'], 'mock.package')
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        self.load('mock.package')
+
+        self.now += 120
+
+        stale = self.load('mock.package')
+
+        self.assertEqual(stale['loaded_at'], 1000.0)
+
+        self.cache.join()
+
+        self.assertEqual(self.loaded, ['mock.package', 'mock.package'])
+        self.assertEqual(self.load('mock.package')['loaded_at'], 1120.0)
+
+    def test_stale_entry_is_refreshed_by_get(self):
+        self.load('mock.package')
+
+        self.now += 120
+
+        key = ResponseCache.cache_key('details', 'mock.package')
+
+        self.assertEqual(self.cache.get(key, self.load.loader, 'mock.package')['loaded_at'], 1000.0)
+
+        self.cache.join()
+
+        self.assertEqual(self.loaded, ['mock.package', 'mock.package'])
+        self.assertEqual(self.cache.get(key)['loaded_at'], 1120.0)
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        self.load('mock.package')
+
+        self.now += 120
+
+        def failing_loader(package_name):
+            raise Exception('Upstream failure')
+
+        key = ResponseCache.cache_key('details', 'mock.package')
+
+        self.assertEqual(self.cache.get_or_load(key, failing_loader, 'mock.package')['loaded_at'], 1000.0)
+
+        self.cache.join()
+
+        self.assertEqual(self.cache.get(key)['loaded_at'], 1000.0)
+
+    def test_refresh_workers_survive_login_failures(self):
+        self.load('mock.package')
+        self.load('other.package')
+
+        self.now += 120
+
+        def failing_loader(package_name):
+            raise ApiLoginException('Login failed')
+
+        for package_name in ('mock.package', 'other.package'):
+            self.cache.get_or_load(ResponseCache.cache_key('details', package_name), failing_loader, package_name)
+
+        self.cache.join()
+
+        self.assertEqual(len([worker for worker in self.cache._workers if worker.is_alive()]), 2)
+        self.assertEqual(self.cache._refreshing, set())
+
+        self.assertEqual(self.load('mock.package')['loaded_at'], 1000.0)
+        self.cache.join()
+
+        self.assertEqual(self.load('mock.package')['loaded_at'], 1120.0)
+
+    def test_expired_entry_is_served_when_upstream_is_unavailable(self):
+        cache = ResponseCache(SimpleCache(), soft_timeout=60, hard_timeout=600, stale_if_error=3600)
+        available = [True]
+
+        @cache.cached('stale-if-error')
+        def load(package_name):
+            if not available[0]:
+                raise UpstreamUnavailable('circuit open')
+
+            return {'package_name': package_name, 'loaded_at': self.now}
+
+        load('mock.package')
+
+        self.now += 1200
+
+        available[0] = False
+
+        self.assertEqual(load('mock.package')['loaded_at'], 1000.0)
+        self.assertIsNone(cache.get('stale-if-error:mock.package'))
+        self.assertEqual(cache.get_many(load, ['mock.package']), {})
+        self.assertEqual(cache.get_many(load, ['mock.package'], include_expired=True)['mock.package']['loaded_at'],
+                         1000.0)
+
+        available[0] = True
+
+        self.assertEqual(load('mock.package')['loaded_at'], 2200.0)
+
+    def test_expired_entry_is_not_served_on_other_errors(self):
+        self.load('mock.package')
+
+        self.now += 1200
+
+        def failing_loader(package_name):
+            raise Exception('Upstream failure')
+
+        key = ResponseCache.cache_key('details', 'mock.package')
+
+        self.assertRaises(Exception, self.cache.get_or_load, key, failing_loader, 'mock.package')
+
+    def test_permanent_errors_are_remembered(self):
+        cache = ResponseCache(SimpleCache(), soft_timeout=60, hard_timeout=600,
+                              negative_cache=NegativeCache(lambda error: isinstance(error, KeyError), timeout=30))
+        loaded = list()
+
+        @cache.cached('negative')
+        def load(package_name):
+            loaded.append(package_name)
+            raise KeyError(package_name) if package_name.startswith('missing') else IOError(package_name)
+
+        for _ in range(2):
+            self.assertRaises(KeyError, load, 'missing.package')
+            self.assertRaises(IOError, load, 'failing.package')
+
+        self.assertEqual(loaded, ['missing.package', 'failing.package', 'failing.package'])
+        self.assertIsInstance(cache.get_error('negative:missing.package'), KeyError)
+        self.assertIsNone(cache.get_error('negative:failing.package'))
+
+        self.assertEqual(REGISTRY.get_sample_value('googleplay_response_cache_requests_total',
+                                                   {'cache': 'negative', 'result': 'negative'}), 2)
+
+        self.now += 30
+
+        self.assertRaises(KeyError, load, 'missing.package')
+        self.assertEqual(loaded.count('missing.package'), 2)
+
+
+class NegativeCacheTest(unittest.TestCase):
+    def test_bounded_size(self):
+        cache = NegativeCache(lambda error: True, timeout=60, max_entries=2)
+
+        for key in ('first', 'second', 'third'):
+            self.assertTrue(cache.set(key, KeyError(key)))
+
+        self.assertIsNone(cache.get('first'))
+        self.assertIsNotNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+
+    def test_only_permanent_errors_are_remembered(self):
+        cache = NegativeCache(lambda error: isinstance(error, KeyError))
+
+        self.assertFalse(cache.set('failing', IOError('Upstream failure')))
+        self.assertIsNone(cache.get('failing'))
@@ -0,0 +1,106 @@
+import threading
+import unittest
+
+from coalescing import coalesced, SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.single_flight = SingleFlight()
+
+        self.calls = list()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def _slow_call(self, key):
+        self.calls.append(key)
+        self.started.set()
+        self.release.wait(5)
+
+        return 'result for %s' % key
+
+    def _run_concurrently(self, count, target):
+        results = list()
+
+        def run():
+            results.append(target())
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+
+        threads[0].start()
+        self.started.wait(5)
+
+        for thread in threads[1:]:
+            thread.start()
+
+        self._wait_for_waiters('key', count - 1)
+        self.release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        return results
+
+    def _wait_for_waiters(self, key, count):
+        for _ in range(500):
+            if self.single_flight.in_flight() == 0 or self.single_flight.waiting(key) >= count:
+                return
+
+            threading.Event().wait(0.01)
+
+    def test_concurrent_calls_are_coalesced(self):
+        results = self._run_concurrently(
+            10, lambda: self.single_flight.do('key', self._slow_call, 'key')
+        )
+
+        self.assertEqual(self.calls, ['key'])
+        self.assertEqual(results, ['result for key'] * 10)
+        self.assertEqual(self.single_flight.in_flight(), 0)
+        self.assertEqual(self.single_flight.waiting('key'), 0)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        self.release.set()
+
+        self.single_flight.do('key', self._slow_call, 'key')
+        self.single_flight.do('key', self._slow_call, 'key')
+
+        self.assertEqual(self.calls, ['key', 'key'])
+
+    def test_errors_are_shared(self):
+        errors = list()
+
+        def failing():
+            self.calls.append('key')
+            self.started.set()
+            self.release.wait(5)
+
+            raise ValueError('Upstream failure')
+
+        def run():
+            try:
+                self.single_flight.do('key', failing)
+
+            except ValueError as ex:
+                errors.append(ex)
+
+        self._run_concurrently(3, run)
+
+        self.assertEqual(self.calls, ['key'])
+        self.assertEqual(len(errors), 3)
+
+    def test_decorator(self):
+        class Client(object):
+            def __init__(self):
+                self._single_flight = SingleFlight()
+                self.calls = list()
+
+            @coalesced
+            def get_details(self, package_name):
+                self.calls.append(package_name)
+                return package_name.upper()
+
+        client = Client()
+
+        self.assertEqual(client.get_details('mock.package'), 'MOCK.PACKAGE')
+        self.assertEqual(client.get_details.__name__, 'get_details')
+        self.assertEqual(client.calls, ['mock.package'])
@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+
+import deadlines
+
+
+class DeadlinesTest(unittest.TestCase):
+    def tearDown(self):
+        deadlines.clear()
+
+    def test_no_deadline(self):
+        self.assertIsNone(deadlines.current())
+        self.assertIsNone(deadlines.remaining())
+        self.assertEqual(deadlines.timeout(5), 5)
+
+        deadlines.check()
+
+        deadlines.start(0)
+
+        self.assertIsNone(deadlines.current())
+
+    def test_timeout(self):
+        deadlines.start(10)
+
+        self.assertEqual(deadlines.timeout(5), 5)
+        self.assertLessEqual(deadlines.timeout(20), 10)
+        self.assertGreater(deadlines.timeout(), 9)
+
+        deadlines.check()
+
+    def test_exceeded(self):
+        deadlines.start(0.01)
+
+        time.sleep(0.02)
+
+        self.assertEqual(deadlines.remaining(), 0)
+        self.assertRaises(deadlines.DeadlineExceeded, deadlines.check)
+        self.assertRaises(deadlines.DeadlineExceeded, deadlines.timeout, 5)
+
+    def test_inherited(self):
+        deadlines.start(10)
+
+        deadline = deadlines.current()
+        inherited = list()
+
+        def work():
+            inherited.append(deadlines.current())
+
+            with deadlines.inherited(deadline):
+                inherited.append(deadlines.current())
+
+            inherited.append(deadlines.current())
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(inherited, [None, deadline, None])
+
+    def test_acquire(self):
+        lock = threading.Lock()
+
+        deadlines.acquire(lambda: lock.acquire(False))
+
+        self.assertTrue(lock.locked())
+
+        deadlines.start(0.1)
+
+        started_at = time.time()
+
+        self.assertRaises(deadlines.DeadlineExceeded, deadlines.acquire, lambda: lock.acquire(False))
+        self.assertLess(time.time() - started_at, 1)
+
+        lock.release()
+
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import disk_cache
+from disk_cache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        self.original_time = disk_cache.time
+        disk_cache.time = self
+
+        self.now = 1000.0
+
+    def tearDown(self):
+        disk_cache.time = self.original_time
+
+        shutil.rmtree(self.directory)
+
+    def time(self):
+        return self.now
+
+    def _files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_set_and_get(self):
+        cache = DiskCache(self.directory)
+
+        self.assertIsNone(cache.get('http://mock/page'))
+
+        cache.set('http://mock/page', '<html>content</html>')
+
+        self.assertEqual(cache.get('http://mock/page'), '<html>content</html>')
+        self.assertEqual(cache.stats(), {'entries': 1, 'size': 20, 'hits': 1, 'misses': 1, 'evictions': 0})
+
+    def test_compression(self):
+        cache = DiskCache(self.directory, compress=True)
+
+        data = '<html>%s</html>' % ('content ' * 1000)
+
+        cache.set('http://mock/page', data)
+
+        self.assertEqual(cache.get('http://mock/page'), data)
+        self.assertLess(cache.stats()['size'], len(data))
+        self.assertTrue(self._files()[0].endswith('.cache.z'))
+
+    def test_max_age(self):
+        cache = DiskCache(self.directory, max_age=60)
+
+        cache.set('http://mock/page', 'content')
+
+        self.now += 59
+        self.assertEqual(cache.get('http://mock/page'), 'content')
+
+        self.now += 1
+        self.assertIsNone(cache.get('http://mock/page'))
+        self.assertEqual(self._files(), [])
+
+    def test_lru_eviction_by_entries(self):
+        cache = DiskCache(self.directory, max_entries=2)
+
+        cache.set('first', '1')
+        cache.set('second', '2')
+
+        cache.get('first')
+
+        cache.set('third', '3')
+
+        self.assertEqual(cache.get('first'), '1')
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), '3')
+
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(len(self._files()), 2)
+
+    def test_eviction_by_size(self):
+        cache = DiskCache(self.directory, max_size=10)
+
+        cache.set('first', '12345')
+        cache.set('second', '12345')
+        cache.set('third', '12345')
+
+        self.assertIsNone(cache.get('first'))
+        self.assertEqual(cache.stats()['size'], 10)
+
+    def test_overwrite(self):
+        cache = DiskCache(self.directory)
+
+        cache.set('key', 'first')
+        cache.set('key', 'second value')
+
+        self.assertEqual(cache.get('key'), 'second value')
+        self.assertEqual(cache.stats()['size'], 12)
+        self.assertEqual(len(self._files()), 1)
+
+    def test_index_is_restored(self):
+        cache = DiskCache(self.directory)
+
+        cache.set('key', 'content')
+
+        with open(os.path.join(self.directory, '.tmp-leftover'), 'w') as leftover:
+            leftover.write('partial')
+
+        restored = DiskCache(self.directory)
+
+        self.assertEqual(restored.get('key'), 'content')
+        self.assertEqual(restored.stats()['entries'], 1)
+        self.assertEqual(len(self._files()), 1)
+
+    def test_removed_file(self):
+        cache = DiskCache(self.directory)
+
+        cache.set('key', 'content')
+
+        for filename in self._files():
+            os.remove(os.path.join(self.directory, filename))
+
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_entries_stored_by_another_process(self):
+        cache = DiskCache(self.directory)
+        other = DiskCache(self.directory, compress=True)
+
+        other.set('key', 'content')
+
+        self.assertEqual(cache.get('key'), 'content')
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
@@ -0,0 +1,149 @@
+import threading
+import unittest
+
+from prometheus_client import REGISTRY
+
+import governor
+import ratelimit
+from governor import CircuitBreaker, UpstreamGovernor, UpstreamUnavailable, CLOSED, HALF_OPEN, OPEN
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.original_time = governor.time
+        governor.time = self
+
+        self.now = 1000.0
+
+    def tearDown(self):
+        governor.time = self.original_time
+
+    def time(self):
+        return self.now
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.retry_after(), 30)
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+
+        breaker.record_failure()
+
+        self.now += 30
+
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, OPEN)
+
+        self.now += 30
+
+        self.assertTrue(breaker.allow())
+
+        breaker.record_success()
+
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+
+class UpstreamGovernorTest(unittest.TestCase):
+    def test_fails_fast_when_circuit_is_open(self):
+        upstream = UpstreamGovernor(failure_threshold=2, reset_timeout=60)
+        calls = list()
+
+        def call(error=None):
+            with upstream.permit(lambda ex: not isinstance(ex, KeyError)):
+                calls.append(error)
+
+                if error is not None:
+                    raise error
+
+        self.assertRaises(KeyError, call, KeyError('not found'))
+        self.assertRaises(KeyError, call, KeyError('not found'))
+
+        self.assertEqual(upstream.state, CLOSED)
+
+        self.assertRaises(IOError, call, IOError('upstream failure'))
+        self.assertRaises(IOError, call, IOError('upstream failure'))
+
+        self.assertEqual(upstream.state, OPEN)
+
+        with self.assertRaises(UpstreamUnavailable) as context:
+            call()
+
+        self.assertEqual(context.exception.reason, 'circuit open')
+        self.assertGreater(context.exception.retry_after, 0)
+        self.assertEqual(len(calls), 4)
+
+        self.assertEqual(REGISTRY.get_sample_value('googleplay_upstream_circuit_state'), 2)
+
+    def test_bounded_wait_queue(self):
+        upstream = UpstreamGovernor(rate_limit=1, rate_limit_burst=1, max_waiting=1, max_wait=5)
+
+        original_acquire = ratelimit.TokenBucket.acquire
+        waiting, release = threading.Event(), threading.Event()
+
+        def acquire(bucket, tokens=1, timeout=None):
+            waiting.set()
+            release.wait()
+            return True
+
+        with upstream.permit():
+            pass
+
+        ratelimit.TokenBucket.acquire = acquire
+
+        try:
+            def wait():
+                with upstream.permit():
+                    pass
+
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+
+            waiting.wait()
+
+            with self.assertRaises(UpstreamUnavailable) as context:
+                with upstream.permit():
+                    pass
+
+            self.assertEqual(context.exception.reason, 'too many waiting calls')
+            self.assertEqual(REGISTRY.get_sample_value('googleplay_upstream_waiting_calls'), 1)
+
+            release.set()
+            waiter.join()
+
+        finally:
+            ratelimit.TokenBucket.acquire = original_acquire
+
+    def test_wait_timeout(self):
+        upstream = UpstreamGovernor(rate_limit=0.1, rate_limit_burst=1, max_wait=1)
+
+        with upstream.permit():
+            pass
+
+        with self.assertRaises(UpstreamUnavailable) as context:
+            with upstream.permit():
+                pass
+
+        self.assertEqual(context.exception.reason, 'rate limit wait timed out')
+        self.assertGreater(context.exception.retry_after, 1)
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import gunicorn_config
+
+
+class GunicornConfigTest(unittest.TestCase):
+    def tearDown(self):
+        for key in ('HTTP_PORT', 'HTTP_WORKERS', 'HTTP_THREADS', 'HTTP_PRELOAD_APP', 'prometheus_multiproc_dir'):
+            os.environ.pop(key, None)
+
+        reload(gunicorn_config)
+
+    def test_defaults(self):
+        self.assertEqual(gunicorn_config.bind, '127.0.0.1:5000')
+        self.assertGreaterEqual(gunicorn_config.workers, 1)
+        self.assertEqual(gunicorn_config.threads, 8)
+        self.assertEqual(gunicorn_config.worker_class, 'gthread')
+        self.assertTrue(gunicorn_config.preload_app)
+
+    def test_configuration(self):
+        os.environ.update({'HTTP_PORT': '8080', 'HTTP_WORKERS': '3', 'HTTP_THREADS': '1', 'HTTP_PRELOAD_APP': 'no'})
+
+        reload(gunicorn_config)
+
+        self.assertEqual(gunicorn_config.bind, '127.0.0.1:8080')
+        self.assertEqual(gunicorn_config.workers, 3)
+        self.assertEqual(gunicorn_config.threads, 1)
+        self.assertEqual(gunicorn_config.worker_class, 'sync')
+        self.assertFalse(gunicorn_config.preload_app)
+
+    def test_metrics_directory_is_cleared_on_start(self):
+        parent = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, parent)
+
+        directory = os.path.join(parent, 'prometheus')
+        os.environ['prometheus_multiproc_dir'] = directory
+
+        gunicorn_config.on_starting(None)
+
+        self.assertTrue(os.path.isdir(directory))
+
+        with open(os.path.join(directory, 'counter_1.db'), 'w') as metrics_file:
+            metrics_file.write('stale')
+
+        gunicorn_config.on_starting(None)
+
+        self.assertEqual(os.listdir(directory), [])
+
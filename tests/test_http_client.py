@@ -0,0 +1,142 @@
+import gzip
+import threading
+import time
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler
+from SocketServer import ThreadingTCPServer
+from StringIO import StringIO
+
+import deadlines
+from http_client import HttpClient, HttpError
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+
+        if self.path == '/redirect':
+            self._respond(302, '', location='/content')
+
+        elif self.path == '/slow':
+            time.sleep(0.5)
+            self._respond(200, '<html>slow</html>')
+
+        elif self.path == '/missing':
+            self._respond(404, 'Not found')
+
+        elif self.path == '/gzip' and 'gzip' in self.headers.get('accept-encoding', ''):
+            compressed = StringIO()
+
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as output:
+                output.write('<html>compressed</html>')
+
+            self._respond(200, compressed.getvalue(), content_encoding='gzip')
+
+        else:
+            self._respond(200, '<html>%s</html>' % self.path)
+
+    def _respond(self, status, body, location=None, content_encoding=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+
+        if location:
+            self.send_header('Location', location)
+
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+
+        self.connections = 0
+        self.requests = list()
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server()
+
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+
+        self.base_url = 'http://%s:%d' % self.server.server_address
+        self.client = HttpClient(pool_size=2, connect_timeout=1, read_timeout=1)
+
+    def tearDown(self):
+        self.client.close()
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get(self):
+        self.assertEqual(self.client.get('%s/page?q=1' % self.base_url), '<html>/page?q=1</html>')
+
+    def test_connections_are_reused(self):
+        for idx in range(5):
+            self.assertEqual(self.client.get('%s/page%d' % (self.base_url, idx)), '<html>/page%d</html>' % idx)
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_gzip(self):
+        self.assertEqual(self.client.get('%s/gzip' % self.base_url), '<html>compressed</html>')
+
+        self.assertEqual(self.server.requests[0][1].get('accept-encoding'), 'gzip')
+
+    def test_redirect(self):
+        self.assertEqual(self.client.get('%s/redirect' % self.base_url), '<html>/content</html>')
+
+    def test_error(self):
+        try:
+            self.client.get('%s/missing' % self.base_url)
+
+            self.fail('Expected an HTTP error')
+
+        except HttpError as ex:
+            self.assertEqual(ex.status, 404)
+
+        self.assertEqual(self.client.get('%s/after-error' % self.base_url), '<html>/after-error</html>')
+        self.assertEqual(self.server.connections, 1)
+
+    def test_timeout_is_limited_by_the_deadline(self):
+        deadlines.start(0.1)
+
+        try:
+            started_at = time.time()
+
+            self.assertRaises(deadlines.DeadlineExceeded, self.client.get, '%s/slow' % self.base_url)
+            self.assertLess(time.time() - started_at, 0.5)
+
+            self.assertRaises(deadlines.DeadlineExceeded, self.client.get, '%s/page' % self.base_url)
+
+        finally:
+            deadlines.clear()
+
+        self.assertEqual(self.client.get('%s/slow' % self.base_url), '<html>slow</html>')
+
+    def test_stale_connection_is_replaced(self):
+        self.client.get('%s/first' % self.base_url)
+
+        for connection in list(self.client._pools.values())[0].queue:
+            connection.sock.close()
+
+        self.assertEqual(self.client.get('%s/second' % self.base_url), '<html>/second</html>')
+        self.assertEqual(self.server.connections, 2)
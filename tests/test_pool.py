@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+from unittest_helper import get_api_client
+
+from api import ApiLoginException
+from governor import UpstreamGovernor, CLOSED
+from pool import ApiClientPool
+
+
+class ApiClientPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.clients = [get_api_client() for _ in range(3)]
+
+    def test_round_robin(self):
+        pool = ApiClientPool(self.clients)
+
+        for idx in range(6):
+            pool.get_details('hu.rycus.app%d' % idx)
+
+        self.assertEqual([len(client._api.logins) for client in self.clients], [1, 1, 1])
+        self.assertEqual([client.token_generation() for client in self.clients], [1, 1, 1])
+
+    def test_least_loaded(self):
+        pool = ApiClientPool(self.clients, strategy='least-loaded')
+
+        pool._accounts[0].in_flight = 2
+        pool._accounts[1].in_flight = 1
+
+        account = pool._acquire(set())
+
+        self.assertIs(account.client, self.clients[2])
+
+    def test_invalid_strategy(self):
+        self.assertRaises(ValueError, ApiClientPool, self.clients, strategy='random')
+
+    def test_accounts_without_capacity_are_skipped(self):
+        clients = [get_api_client(rate_limit=1, rate_limit_burst=1) for _ in range(2)]
+        pool = ApiClientPool(clients)
+
+        pool.get_details('hu.rycus.app1')
+
+        self.assertFalse(clients[0].has_capacity())
+
+        pool._next_index = 0
+        account = pool._acquire(set())
+
+        self.assertIs(account.client, clients[1])
+
+    def test_failing_accounts_are_ejected(self):
+        clients = [get_api_client(unauthorized=True, max_login_retries=1), get_api_client()]
+        pool = ApiClientPool(clients, max_login_failures=2, ejection_period=60)
+
+        for idx in range(4):
+            self.assertEqual(pool.get_details('hu.rycus.app%d' % idx).get('package_name'), 'hu.rycus.app%d' % idx)
+
+        self.assertEqual(pool.available_accounts(), 1)
+        self.assertGreater(pool._accounts[0].ejected_until, time.time())
+
+    def test_failing_accounts_do_not_open_the_circuit(self):
+        governor = UpstreamGovernor(failure_threshold=2)
+        clients = [get_api_client(unauthorized=True, max_login_retries=3, login_retry_max_delay=0.01,
+                                  governor=governor),
+                   get_api_client(governor=governor)]
+        pool = ApiClientPool(clients, max_login_failures=2, ejection_period=60)
+
+        for idx in range(4):
+            self.assertEqual(pool.get_details('hu.rycus.app%d' % idx).get('package_name'), 'hu.rycus.app%d' % idx)
+
+        self.assertEqual(governor.state, CLOSED)
+        self.assertEqual(pool.available_accounts(), 1)
+
+    def test_all_accounts_failing(self):
+        clients = [get_api_client(unauthorized=True, max_login_retries=1) for _ in range(2)]
+        pool = ApiClientPool(clients)
+
+        self.assertRaises(ApiLoginException, pool.get_details, 'hu.rycus.app1')
+        self.assertRaises(ApiLoginException, pool.login)
+        self.assertRaises(ApiLoginException, pool.get_details_many, ['hu.rycus.app1', 'hu.rycus.app2'])
+
+    def test_details_many_spreads_accounts(self):
+        pool = ApiClientPool(self.clients)
+
+        package_names = ['hu.rycus.app%d' % idx for idx in range(9)]
+        results = pool.get_details_many(package_names)
+
+        self.assertEqual(set(results.keys()), set(package_names))
+        self.assertEqual([client.token_generation() for client in self.clients], [1, 1, 1])
+
+    def test_search(self):
+        pool = ApiClientPool(self.clients)
+
+        self.assertGreater(len(pool.search('hu.rycus')), 0)
+        self.assertTrue(pool.is_logged_in())
+
+    def test_concurrent_calls_are_coalesced_across_accounts(self):
+        pool = ApiClientPool(self.clients)
+
+        calls = list()
+        started, release = threading.Event(), threading.Event()
+
+        def slow_details(package_name):
+            calls.append(package_name)
+            started.set()
+            release.wait(5)
+
+            return {'package_name': package_name}
+
+        for client in self.clients:
+            client.get_details = slow_details
+
+        results = list()
+        threads = [
+            threading.Thread(target=lambda: results.append(pool.get_details('hu.rycus.app'))) for _ in range(3)
+        ]
+
+        threads[0].start()
+        started.wait(5)
+
+        for thread in threads[1:]:
+            thread.start()
+
+        for _ in range(500):
+            if pool._single_flight.waiting(('get_details', 'hu.rycus.app')) >= 2:
+                break
+
+            time.sleep(0.01)
+
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(calls, ['hu.rycus.app'])
+        self.assertEqual(results, [{'package_name': 'hu.rycus.app'}] * 3)
@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+from profiling import SamplingProfiler
+
+
+def _profiled_work(profiler, finished):
+    profiler.request_started()
+
+    try:
+        while not finished.is_set():
+            time.sleep(0.001)
+
+    finally:
+        profiler.request_finished()
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.profiler = SamplingProfiler(interval=0.001)
+
+    def test_folded_stacks(self):
+        finished = threading.Event()
+
+        self.assertTrue(self.profiler.start(1))
+        self.assertFalse(self.profiler.start(1))
+
+        worker = threading.Thread(target=_profiled_work, args=(self.profiler, finished))
+        worker.start()
+
+        time.sleep(0.05)
+        finished.set()
+
+        stacks = self.profiler.wait(5).splitlines()
+
+        worker.join()
+
+        self.assertGreater(len(stacks), 0)
+
+        for line in stacks:
+            stack, count = line.rsplit(' ', 1)
+
+            self.assertIn('_profiled_work (test_profiling.py:', stack)
+            self.assertGreater(int(count), 0)
+
+        self.assertTrue(self.profiler.start(1))
+        self.assertEqual(self.profiler.wait(0), '')
+
+    def test_requests_are_not_profiled_when_not_started(self):
+        self.profiler.request_started()
+        self.profiler.request_finished()
+
+        self.assertTrue(self.profiler.start(1))
+        self.assertEqual(self.profiler.wait(0), '')
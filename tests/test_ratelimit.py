@@ -0,0 +1,62 @@
+import unittest
+
+import ratelimit
+from ratelimit import TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.original_time = ratelimit.time
+        ratelimit.time = self
+
+        self.now = 1000.0
+        self.slept = list()
+
+    def tearDown(self):
+        ratelimit.time = self.original_time
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+
+        bucket.try_acquire(2)
+
+        self.now += 0.5
+
+        self.assertAlmostEqual(bucket.available(), 1.0)
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+        self.now += 10
+
+        self.assertAlmostEqual(bucket.available(), 2.0)
+
+    def test_acquire_waits(self):
+        bucket = TokenBucket(rate=4, capacity=1)
+
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire())
+
+        self.assertEqual(self.slept, [0.25])
+
+    def test_acquire_with_timeout(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+
+        bucket.acquire()
+
+        self.assertFalse(bucket.acquire(timeout=0.5))
+        self.assertEqual(self.slept, [])
@@ -0,0 +1,40 @@
+import gzip
+import json
+import pickle
+import unittest
+from StringIO import StringIO
+
+from responses import encode, join_object, serialize, supported_encodings
+
+
+class ResponsesTest(unittest.TestCase):
+    def test_encode(self):
+        body = serialize([{'package_name': 'com.example.app%d' % idx, 'title': 'Example'} for idx in range(20)])
+
+        encoded = encode(body, ['gzip'])
+
+        self.assertEqual(encoded.body, body)
+        self.assertEqual(list(encoded.variants.keys()), ['gzip'])
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(encoded.variants['gzip'])).read(), body)
+
+        self.assertEqual(encoded.encoded('gzip'), (encoded.variants['gzip'], '%s-gzip' % encoded.etag))
+        self.assertEqual(encoded.encoded(None), (body, encoded.etag))
+
+        self.assertEqual(encode(body, ['gzip']), encoded)
+        self.assertEqual(pickle.loads(pickle.dumps(encoded, pickle.HIGHEST_PROTOCOL)), encoded)
+
+    def test_small_bodies_are_not_compressed(self):
+        encoded = encode(serialize(None), ['gzip'])
+
+        self.assertEqual(encoded.body, 'null')
+        self.assertEqual(encoded.variants, {})
+        self.assertEqual(encoded.encoded('gzip'), ('null', encoded.etag))
+
+    def test_join_object(self):
+        body = join_object([(u'com.example.\xe1', serialize({'title': u'\xe1'})), ('com.example.b', 'null')])
+
+        self.assertEqual(json.loads(body), {u'com.example.\xe1': {'title': u'\xe1'}, 'com.example.b': None})
+
+    def test_supported_encodings(self):
+        self.assertEqual(supported_encodings(['gzip']), ('gzip',))
+        self.assertRaises(ValueError, supported_encodings, ['deflate'])
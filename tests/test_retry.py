@@ -0,0 +1,99 @@
+import unittest
+
+import deadlines
+import retry
+from governor import UpstreamUnavailable
+from retry import RetryBudget, RetryPolicy
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.original_time = retry.time
+        retry.time = self
+
+        self.now = 1000.0
+        self.slept = list()
+        self.calls = 0
+
+    def tearDown(self):
+        retry.time = self.original_time
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def _failing(self, *errors):
+        def call():
+            self.calls += 1
+
+            if self.calls <= len(errors):
+                raise errors[self.calls - 1]
+
+            return 'result'
+
+        return call
+
+    def test_retries_with_backoff(self):
+        policy = RetryPolicy('test', max_attempts=4, base_delay=1, max_delay=3)
+
+        self.assertEqual(policy.call(self._failing(IOError(), IOError(), IOError())), 'result')
+        self.assertEqual(self.calls, 4)
+
+        self.assertEqual(len(self.slept), 3)
+
+        for delay, limit in zip(self.slept, (1, 2, 3)):
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, limit)
+
+    def test_gives_up_after_max_attempts(self):
+        policy = RetryPolicy('test', max_attempts=2, base_delay=0.1)
+
+        self.assertRaises(IOError, policy.call, self._failing(IOError(), IOError(), IOError()))
+        self.assertEqual(self.calls, 2)
+
+    def test_only_retryable_errors_are_retried(self):
+        policy = RetryPolicy('test', max_attempts=5, retryable=lambda error: isinstance(error, IOError))
+
+        self.assertRaises(KeyError, policy.call, self._failing(IOError(), KeyError()))
+        self.assertEqual(self.calls, 2)
+
+        self.calls = 0
+
+        self.assertRaises(UpstreamUnavailable, policy.call, self._failing(UpstreamUnavailable('circuit open')))
+        self.assertEqual(self.calls, 1)
+
+    def test_stops_at_the_deadline(self):
+        policy = RetryPolicy('test', max_attempts=5, base_delay=10, max_delay=10)
+
+        retry.time = self.original_time
+        deadlines.start(0.05)
+
+        try:
+            policy._random.uniform = lambda low, high: high
+
+            self.assertRaises(deadlines.DeadlineExceeded, policy.call, self._failing(IOError(), IOError()))
+            self.assertEqual(self.calls, 1)
+
+        finally:
+            deadlines.clear()
+
+    def test_budget(self):
+        budget = RetryBudget(max_failure_ratio=0.5, window=10, min_calls=4)
+        policy = RetryPolicy('test', max_attempts=3, base_delay=0.1, budget=budget)
+
+        self.assertEqual(policy.call(self._failing(IOError())), 'result')
+        self.assertTrue(budget.allows_retry())
+
+        self.calls = 0
+
+        # 3 failures out of 4 calls exceeds the budget
+        self.assertRaises(IOError, policy.call, self._failing(IOError(), IOError()))
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(budget.allows_retry())
+
+        self.now += 10
+
+        self.assertTrue(budget.allows_retry())
@@ -1,60 +1,169 @@
+import shutil
+import socket
+import tempfile
+import threading
+import time
 import unittest
 
+from prometheus_client import REGISTRY
+
 import scraper
+from disk_cache import DiskCache
+from http_client import HttpError
+
+try:
+    import lxml
+except ImportError:  # pragma: no cover
+    lxml = None
+
+
+SEARCH_HTML = """
+<html><body>
+<div class="card" data-docid="mock.package.app1">
+    <a class="subtitle" title="Developer1">Developer1</a>
+    <a class="card-click-target" href="http://share.url/app1">Link</a>
+    <a class="title" title="App1">App1</a>
+    <div class="description">
+        Description for<br/>
+        application1
+    </div>
+    <img class="cover-image" src="image1-main"
+         data-cover-small="image1-small" data-cover-large="image1-large"/>
+</div>
+<div class="card" data-docid="mock.package.app2">
+    <a class="subtitle" title="Developer2">Developer2</a>
+    <a class="card-click-target" href="http://share.url/app2">Link</a>
+    <a class="title" title="App2">App2</a>
+    <div class="description">
+        Description for<br/>
+        application2
+    </div>
+    <img class="cover-image" src="image2-main"
+         data-cover-small="image2-small" data-cover-large="image2-large"/>
+</div>
+<div class="card" data-docid="different.package.app3"></div>
+</body></html>
+"""
+
+
+DEVELOPER_HTML = """
+<html><body>
+<div class="card" data-docid="mock.package.app1">
+    <a class="subtitle" title="Test Dev">Test Dev</a>
+    <a class="card-click-target" href="http://share.url/app1">Link</a>
+    <a class="title" title="App1">App1</a>
+    <div class="description">
+        Description for<br/>
+        application1
+    </div>
+    <img class="cover-image" src="image1-main"
+         data-cover-small="image1-small" data-cover-large="image1-large"/>
+</div>
+<div class="card" data-docid="mock.package.app2">
+    <a class="subtitle" title="Test Dev">Test Dev</a>
+    <a class="card-click-target" href="http://share.url/app2">Link</a>
+    <a class="title" title="App2">App2</a>
+    <div class="description">
+        Description for<br/>
+        application2
+    </div>
+    <img class="cover-image" src="image2-main"
+         data-cover-small="image2-small" data-cover-large="image2-large"/>
+</div>
+</body></html>
+"""
+
+
+DETAILS_HTML = """
+<html><head>
+    <link rel="canonical" href="http://share.url"/>
+</head><body>
+<div class="main-content">
+    <meta data-docid="mock.package.app"/>
+    <span itemprop="genre">Genre 1</span>
+    <span itemprop="genre">Genre 2</span>
+    <div class="document-title">App Title</div>
+    <div itemprop="author">
+        <a class="primary"><span itemprop="name">Developer Name</span></a>
+        <a class="dev-link" href="https://developer.site">Dev Site</a>
+    </div>
+    <img class="cover-image" src="//cover.image"/>
+    <img class="full-screenshot" src="http://screenshot.image"/>
+    <div class="show-more-content">
+        <div>App Description</div>
+    </div>
+    <div class="reviews">
+        <meta itemprop="ratingValue" content="3.2"/>
+        <meta itemprop="ratingCount" content="42"/>
+        <div class="rating-bar-container one">
+            <span class="bar-number">10</span>
+        </div>
+        <div class="rating-bar-container two">
+            <span class="bar-number">20</span>
+        </div>
+        <div class="rating-bar-container three">
+            <span class="bar-number">30</span>
+        </div>
+        <div class="rating-bar-container four">
+            <span class="bar-number">40</span>
+        </div>
+        <div class="rating-bar-container five">
+            <span class="bar-number">50</span>
+        </div>
+    </div>
+    <div class="whatsnew">
+        <div class="recent-change">
+            A recent
+            change
+        </div>
+        <div class="recent-change">
+            Another change
+        </div>
+    </div>
+    <div itemprop="datePublished">PublishDate</div>
+    <div itemprop="numDownloads">DownloadCount</div>
+</div>
+</body></html>
+"""
 
 
 class ScraperTest(unittest.TestCase):
     def setUp(self):
-        self.scraper = scraper.Scraper(cache_max_age=0)
-
-        self.original_urlopen = scraper.urlopen
-        scraper.urlopen = self._mock_urlopen
+        self.scraper = scraper.Scraper(cache_max_age=0, http_client=self)
 
         self.opened_url = None
         self.response_data = None
+        self.errors = list()
 
-    def tearDown(self):
-        scraper.urlopen = self.original_urlopen
-
-    def _mock_urlopen(self, url):
+    def get(self, url):
         self.opened_url = url
 
-        _self = self
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return self.response_data
+
+    def test_transient_errors_are_retried(self):
+        self.scraper._fetch_retry.base_delay = 0.01
 
-        class MockResponse(object):
-            def read(self):
-                return _self.response_data
+        self.response_data = SEARCH_HTML
+        self.errors = [HttpError('https://play.google.com', 503), socket.error('Connection reset')]
 
-        return MockResponse()
+        self.assertEqual(len(self.scraper.search('mock.package')), 2)
+        self.assertEqual(self.errors, [])
+
+        self.errors = [HttpError('https://play.google.com', 404), HttpError('https://play.google.com', 503)]
+
+        self.assertRaises(HttpError, self.scraper.search, 'mock.missing')
+        self.assertEqual(len(self.errors), 1)
+
+        self.errors = [HttpError('https://play.google.com', 503) for _ in range(3)]
+
+        self.assertRaises(HttpError, self.scraper.search, 'mock.failing')
+        self.assertEqual(self.errors, [])
 
     def test_search(self):
-        self.response_data = """
-        <html><body>
-        <div class="card" data-docid="mock.package.app1">
-            <a class="subtitle" title="Developer1">Developer1</a>
-            <a class="card-click-target" href="http://share.url/app1">Link</a>
-            <a class="title" title="App1">App1</a>
-            <div class="description">
-                Description for<br/>
-                application1
-            </div>
-            <img class="cover-image" src="image1-main"
-                 data-cover-small="image1-small" data-cover-large="image1-large"/>
-        </div>
-        <div class="card" data-docid="mock.package.app2">
-            <a class="subtitle" title="Developer2">Developer2</a>
-            <a class="card-click-target" href="http://share.url/app2">Link</a>
-            <a class="title" title="App2">App2</a>
-            <div class="description">
-                Description for<br/>
-                application2
-            </div>
-            <img class="cover-image" src="image2-main"
-                 data-cover-small="image2-small" data-cover-large="image2-large"/>
-        </div>
-        <div class="card" data-docid="different.package.app3"></div>
-        </body></html>
-        """
+        self.response_data = SEARCH_HTML
 
         result = self.scraper.search('mock.package')
 
@@ -81,32 +190,7 @@ class ScraperTest(unittest.TestCase):
             )
 
     def test_developer(self):
-        self.response_data = """
-        <html><body>
-        <div class="card" data-docid="mock.package.app1">
-            <a class="subtitle" title="Test Dev">Test Dev</a>
-            <a class="card-click-target" href="http://share.url/app1">Link</a>
-            <a class="title" title="App1">App1</a>
-            <div class="description">
-                Description for<br/>
-                application1
-            </div>
-            <img class="cover-image" src="image1-main"
-                 data-cover-small="image1-small" data-cover-large="image1-large"/>
-        </div>
-        <div class="card" data-docid="mock.package.app2">
-            <a class="subtitle" title="Test Dev">Test Dev</a>
-            <a class="card-click-target" href="http://share.url/app2">Link</a>
-            <a class="title" title="App2">App2</a>
-            <div class="description">
-                Description for<br/>
-                application2
-            </div>
-            <img class="cover-image" src="image2-main"
-                 data-cover-small="image2-small" data-cover-large="image2-large"/>
-        </div>
-        </body></html>
-        """
+        self.response_data = DEVELOPER_HTML
 
         result = self.scraper.developer('Test Dev')
 
@@ -133,57 +217,7 @@ class ScraperTest(unittest.TestCase):
             )
 
     def test_get_details(self):
-        self.response_data = """
-        <html><head>
-            <link rel="canonical" href="http://share.url"/>
-        </head><body>
-        <div class="main-content">
-            <meta data-docid="mock.package.app"/>
-            <span itemprop="genre">Genre 1</span>
-            <span itemprop="genre">Genre 2</span>
-            <div class="document-title">App Title</div>
-            <div itemprop="author">
-                <a class="primary"><span itemprop="name">Developer Name</span></a>
-                <a class="dev-link" href="https://developer.site">Dev Site</a>
-            </div>
-            <img class="cover-image" src="//cover.image"/>
-            <img class="full-screenshot" src="http://screenshot.image"/>
-            <div class="show-more-content">
-                <div>App Description</div>
-            </div>
-            <div class="reviews">
-                <meta itemprop="ratingValue" content="3.2"/>
-                <meta itemprop="ratingCount" content="42"/>
-                <div class="rating-bar-container one">
-                    <span class="bar-number">10</span>
-                </div>
-                <div class="rating-bar-container two">
-                    <span class="bar-number">20</span>
-                </div>
-                <div class="rating-bar-container three">
-                    <span class="bar-number">30</span>
-                </div>
-                <div class="rating-bar-container four">
-                    <span class="bar-number">40</span>
-                </div>
-                <div class="rating-bar-container five">
-                    <span class="bar-number">50</span>
-                </div>
-            </div>
-            <div class="whatsnew">
-                <div class="recent-change">
-                    A recent
-                    change
-                </div>
-                <div class="recent-change">
-                    Another change
-                </div>
-            </div>
-            <div itemprop="datePublished">PublishDate</div>
-            <div itemprop="numDownloads">DownloadCount</div>
-        </div>
-        </body></html>
-        """
+        self.response_data = DETAILS_HTML
 
         result = self.scraper.get_details('mock.package.app')
         
@@ -215,3 +249,227 @@ class ScraperTest(unittest.TestCase):
         for rating in range(1, 6):
             self.assertEqual(result['ratings']['count'][rating], rating * 10)
 
+    def test_get_details_many(self):
+        self.response_data = DETAILS_HTML
+
+        results = self.scraper.get_details_many(['mock.package.app', 'unknown.package', 'mock.package.app'])
+
+        self.assertEqual(set(results.keys()), {'mock.package.app', 'unknown.package'})
+
+        self.assertEqual(results['mock.package.app']['package_name'], 'mock.package.app')
+        self.assertEqual(results['mock.package.app']['title'], 'App Title')
+        self.assertIsNone(results['unknown.package'])
+
+    def test_cached_page(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            cached_scraper = scraper.Scraper(http_client=self,
+                                             disk_cache=DiskCache(directory, max_age=60),
+                                             results_cache=DiskCache(directory + '/results', max_age=0))
+
+            self.response_data = DETAILS_HTML
+
+            self.assertEqual(cached_scraper.get_details('mock.package.app')['title'], 'App Title')
+
+            self.opened_url = None
+
+            self.assertEqual(cached_scraper.get_details('mock.package.app')['title'], 'App Title')
+            self.assertIsNone(self.opened_url)
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_iter_search(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            cached_scraper = scraper.Scraper(http_client=self, disk_cache=DiskCache(directory, max_age=0),
+                                             results_cache=DiskCache(directory + '/results', max_age=60))
+
+            self.response_data = SEARCH_HTML
+
+            items = cached_scraper.iter_search('mock.package')
+
+            self.assertIsNone(self.opened_url)
+
+            first = next(items)
+
+            self.assertIsNotNone(self.opened_url)
+
+            streamed = [first] + list(items)
+
+            self.assertEqual(streamed, self.scraper.search('mock.package'))
+
+            self.opened_url = None
+
+            self.assertEqual(cached_scraper.search('mock.package'), streamed)
+            self.assertEqual(list(cached_scraper.iter_search('mock.package')), streamed)
+            self.assertIsNone(self.opened_url)
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_concurrent_fetches_of_a_page_are_coalesced(self):
+        started, release = threading.Event(), threading.Event()
+        fetched = list()
+
+        def slow_get(url):
+            fetched.append(url)
+            started.set()
+            release.wait(5)
+
+            return SEARCH_HTML
+
+        self.get = slow_get
+
+        results = list()
+        threads = [
+            threading.Thread(target=lambda: results.append(list(self.scraper.iter_search('mock.package'))))
+            for _ in range(5)
+        ]
+
+        threads[0].start()
+        started.wait(5)
+
+        for thread in threads[1:]:
+            thread.start()
+
+        key = ('_fetch', self.scraper.PATH_SEARCH.format(package_prefix='mock.package'), 'search')
+
+        for _ in range(500):
+            if self.scraper._single_flight.waiting(key) >= 4:
+                break
+
+            time.sleep(0.01)
+
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(fetched), 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(len(result) == 2 for result in results))
+
+    def test_metrics(self):
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        fetched_bytes = sample('googleplay_scraper_fetched_bytes_total', page_type='details')
+        parsed = sample('googleplay_scraper_parse_duration_seconds_count', page_type='details')
+        misses = sample('googleplay_scraper_cache_requests_total', cache='pages', result='miss')
+
+        self.response_data = DETAILS_HTML
+
+        self.scraper.get_details('mock.package.app')
+
+        self.assertEqual(sample('googleplay_scraper_fetched_bytes_total', page_type='details'),
+                         fetched_bytes + len(DETAILS_HTML))
+        self.assertEqual(sample('googleplay_scraper_parse_duration_seconds_count', page_type='details'), parsed + 1)
+        self.assertEqual(sample('googleplay_scraper_cache_requests_total', cache='pages', result='miss'), misses + 1)
+
+    def test_cached_result(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            html_cache = DiskCache(directory, max_age=0)
+            results_cache = DiskCache(directory + '/results', max_age=60)
+
+            cached_scraper = scraper.Scraper(http_client=self, disk_cache=html_cache, results_cache=results_cache)
+
+            self.response_data = DETAILS_HTML
+
+            original = cached_scraper.get_details('mock.package.app')
+
+            self.opened_url = None
+
+            def fail_parsing(*args, **kwargs):
+                raise AssertionError('The page should not be parsed again')
+
+            original_soup = scraper.soup
+            scraper.soup = fail_parsing
+
+            try:
+                cached = cached_scraper.get_details('mock.package.app')
+
+            finally:
+                scraper.soup = original_soup
+
+            self.assertEqual(cached, original)
+            self.assertEqual(cached['ratings']['count'][5], 50)
+            self.assertIsNone(self.opened_url)
+
+            self.assertEqual(results_cache.stats()['hits'], 1)
+
+            cached_scraper.PARSER_VERSION += 1
+            cached_scraper.get_details('mock.package.app')
+
+            self.assertIsNotNone(self.opened_url)
+
+        finally:
+            shutil.rmtree(directory)
+
+
+def _noisy(html):
+    return html.replace(
+        '<div class="card"', '<div class="card no-rationale square-cover apps small"'
+    ).replace(
+        '<body>', '<body><div class="header"><a class="title" title="Header">Header</a></div>'
+                  '<script>var card = "<div class=\'card\'>";</script>'
+    ).replace(
+        '</body>', '<div class="footer"><div class="card">No docid</div></div></body>'
+    )
+
+
+class ParserEquivalenceTest(unittest.TestCase):
+    ENGINES = [('html.parser', False), ('html.parser', True)] + \
+              ([('lxml', False), ('lxml', True)] if lxml else [])
+
+    FIXTURES = [
+        ('scrape_search', 'mock.package', SEARCH_HTML),
+        ('scrape_developer', 'Test Dev', DEVELOPER_HTML),
+        ('scrape_details', 'mock.package.app', DETAILS_HTML),
+        ('scrape_search', 'mock.package', _noisy(SEARCH_HTML)),
+        ('scrape_developer', 'Test Dev', _noisy(DEVELOPER_HTML)),
+        ('scrape_details', 'mock.package.app', _noisy(DETAILS_HTML)),
+        ('scrape_details', 'unknown.package', DETAILS_HTML)
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.response_data = None
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, url):
+        return self.response_data
+
+    def _scrape(self, parser, partial_parsing, method, argument):
+        instance = scraper.Scraper(http_client=self,
+                                   disk_cache=DiskCache(self.directory, max_age=0),
+                                   results_cache=DiskCache(self.directory + '/results', max_age=0),
+                                   parser=parser, partial_parsing=partial_parsing)
+
+        result = getattr(instance, method)(argument)
+
+        if method == 'scrape_details':
+            return result
+
+        return list(result)
+
+    def test_engines_produce_identical_output(self):
+        for method, argument, html in self.FIXTURES:
+            self.response_data = html
+
+            expected = self._scrape('html.parser', False, method, argument)
+
+            for parser, partial_parsing in self.ENGINES:
+                self.assertEqual(self._scrape(parser, partial_parsing, method, argument), expected,
+                                 msg='Different output for %s(%s) with %s (partial: %s)' %
+                                     (method, argument, parser, partial_parsing))
+
+    def test_invalid_parser(self):
+        self.assertRaises(ValueError, scraper.Scraper, parser='unknown', http_client=self,
+                          disk_cache=DiskCache(self.directory), results_cache=DiskCache(self.directory))
@@ -0,0 +1,52 @@
+import threading
+import unittest
+
+import timing
+
+
+class TimingTest(unittest.TestCase):
+    def tearDown(self):
+        timing.stop()
+
+    def test_measure(self):
+        timing.start()
+
+        with timing.measure('cache'):
+            pass
+
+        with timing.measure('upstream'):
+            with timing.measure('upstream'):
+                with timing.measure('parse'):
+                    pass
+
+        with timing.measure('cache'):
+            pass
+
+        timings = timing.stop()
+
+        self.assertEqual(set(timings.keys()), {'cache', 'upstream', 'parse'})
+        self.assertGreaterEqual(timings['upstream'], timings['parse'])
+
+        self.assertIsNone(timing.stop())
+
+    def test_not_collected_when_not_started(self):
+        with timing.measure('cache'):
+            pass
+
+        self.assertIsNone(timing.stop())
+
+    def test_other_threads_are_not_collected(self):
+        timing.start()
+
+        def work():
+            with timing.measure('upstream'):
+                pass
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(timing.stop(), {})
+
+    def test_server_timing(self):
+        self.assertEqual(timing.server_timing({'cache': 0.25, 'upstream': 12.0}), 'cache;dur=0.2, upstream;dur=12.0')
@@ -0,0 +1,96 @@
+import fcntl
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from tokens import TokenStore
+import deadlines
+
+
+class TokenStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = TokenStore(os.path.join(self.directory, 'token.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missing_token(self):
+        self.assertEqual(self.store.load(), (None, 0))
+
+    def test_save_and_load(self):
+        self.store.save('mock-token', created_at=1234)
+
+        self.assertEqual(self.store.load(), ('mock-token', 1234))
+        self.assertEqual(stat.S_IMODE(os.stat(self.store.path).st_mode), 0600)
+        self.assertEqual(os.listdir(self.directory), ['token.json'])
+
+    def test_shared_between_instances(self):
+        self.store.save('mock-token')
+
+        self.assertEqual(TokenStore(self.store.path).load()[0], 'mock-token')
+
+    def test_invalidate(self):
+        self.store.save('mock-token')
+
+        self.store.invalidate('other-token')
+        self.assertEqual(self.store.load()[0], 'mock-token')
+
+        self.store.invalidate('mock-token')
+        self.assertIsNone(self.store.load()[0])
+
+    def test_corrupt_file(self):
+        with open(self.store.path, 'w') as token_file:
+            token_file.write('not json')
+
+        self.assertEqual(self.store.load(), (None, 0))
+
+    def test_locked(self):
+        with self.store.locked():
+            self.store.save('mock-token')
+
+        self.assertTrue(os.path.exists('%s.lock' % self.store.path))
+
+    def test_lock_wait_stops_at_the_deadline(self):
+        with open('%s.lock' % self.store.path, 'a') as other_process:
+            fcntl.flock(other_process, fcntl.LOCK_EX)
+
+            deadlines.start(0.1)
+
+            try:
+                with self.assertRaises(deadlines.DeadlineExceeded):
+                    with self.store.locked():
+                        self.fail('The lock should not have been acquired')
+
+            finally:
+                deadlines.clear()
+
+        with self.store.locked():
+            pass
+
+    def test_missing_directory(self):
+        store = TokenStore(os.path.join(self.directory, 'missing', 'token.json'))
+
+        with store.locked():
+            store.save('mock-token')
+
+        self.assertEqual(store.load()[0], 'mock-token')
+
+    def test_lock_file_can_not_be_opened(self):
+        blocked = os.path.join(self.directory, 'blocked')
+
+        with open(blocked, 'w') as blocking_file:
+            blocking_file.write('not a directory')
+
+        store = TokenStore(os.path.join(blocked, 'token.json'))
+        executed = list()
+
+        with store.locked():
+            store.save('mock-token')
+            executed.append(True)
+
+        self.assertEqual(executed, [True])
+        self.assertIsNone(store.load()[0])
+
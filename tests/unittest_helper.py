@@ -1,12 +1,12 @@
 import os
 import json
 
-from api import ApiClient, LoginError
+from api import ApiClient, LoginError, DecodeError
 
 
-def get_api_client(unauthorized=False):
+def get_api_client(unauthorized=False, **kwargs):
     if os.environ.get('INTEGRATION_TESTS'):
-        return get_real_api_client()
+        return get_real_api_client(**kwargs)
 
     class MockResponse(dict):
         def __init__(self, *args, **kwargs):
@@ -18,11 +18,29 @@ def get_api_client(unauthorized=False):
     _md = MockResponse
 
     class MockApi(object):
-        def login(self, *args, **kwargs):
+        def __init__(self):
+            self.bulk_requests = list()
+            self.logins = list()
+            self.revoked_tokens = set()
+            self.authSubToken = None
+
+        def login(self, email=None, password=None, authSubToken=None, proxy=None):
             if unauthorized:
                 raise LoginError('Requested login failure')
 
+            if authSubToken in self.revoked_tokens:
+                raise LoginError('Revoked token')
+
+            self.logins.append(authSubToken)
+            self.authSubToken = authSubToken or 'mock-token-%d' % len(self.logins)
+
+        def _check_token(self):
+            if self.authSubToken in self.revoked_tokens:
+                raise DecodeError('Invalid token')
+
         def search(self, prefix):
+            self._check_token()
+
             return _md({
                 'doc': [
                     _md({
@@ -36,10 +54,25 @@ def get_api_client(unauthorized=False):
             })
 
         def details(self, package):
+            self._check_token()
+
             return _md({
                 'docV2': self._create_mock(package)
             })
 
+        def bulkDetails(self, packages):
+            self.bulk_requests.append(packages)
+
+            return _md({
+                'entry': [
+                    _md({
+                        'doc': self._create_mock(package) if not package.startswith('missing.') else _md({
+                            'details': _md({'appDetails': _md({'packageName': ''})})
+                        })
+                    }) for package in packages
+                ]
+            })
+
         def _create_mock(self, package):
             return _md({
                 'details': _md({
@@ -69,18 +102,19 @@ def get_api_client(unauthorized=False):
 
     class MockApiClient(ApiClient):
         def __init__(self):
-            super(MockApiClient, self).__init__()
+            super(MockApiClient, self).__init__(**kwargs)
             self._api = MockApi()
 
     return MockApiClient()
 
 
-def get_real_api_client():
+def get_real_api_client(**kwargs):
     details = get_access_details()
 
     return ApiClient(android_id=os.environ.get('ANDROID_ID', details.get('androidId')),
                      username=os.environ.get('GOOGLE_USERNAME', details.get('username')),
-                     password=os.environ.get('GOOGLE_PASSWORD', details.get('password')))
+                     password=os.environ.get('GOOGLE_PASSWORD', details.get('password')),
+                     **kwargs)
 
 
 def get_access_details():